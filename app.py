@@ -7,78 +7,556 @@ from folium import GeoJson
 import shapefile
 import branca.colormap as cm
 import json
+import os
+import base64
+import calendar
+import time
+from functools import lru_cache
 
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, Response, request, render_template, jsonify, abort, stream_with_context, g
+
+from src.map_cache import MapCache
+from src.dashboard_snapshot import SnapshotManager
+from src.forecast_arrays import json_chunks, csv_chunks
+from src.compressed_responses import CompressedCache, build_version, choose_encoding, make_etag
+from src.metrics import MetricsRegistry, Histogram, Gauges, SIZE_BUCKETS, cache_stats_gauges
+from src.color_palette import MISSING_COLOR, build_palette, color_indexes
 
 app = Flask(__name__, static_url_path="")
+app.config['MAP_CACHE_SIZE'] = int(os.environ.get('MAP_CACHE_SIZE', 128))
+app.config['MAP_CACHE_DIR'] = os.environ.get('MAP_CACHE_DIR')
+app.config['GEOMETRY_MAX_AGE'] = int(os.environ.get('GEOMETRY_MAX_AGE', 86400))
+app.config['COMPRESSED_CACHE_SIZE'] = int(os.environ.get('COMPRESSED_CACHE_SIZE', 512))
+app.config['API_STREAM_DAYS'] = int(os.environ.get('API_STREAM_DAYS', 92))
+app.config['LOCATE_MAX_POINTS'] = int(os.environ.get('LOCATE_MAX_POINTS', 100000))
+
+app.config['DASHBOARD_DATA_DIR'] = os.environ.get('DASHBOARD_DATA_DIR', 'dashboard_data')
+app.config['SNAPSHOT_WATCH_INTERVAL'] = int(os.environ.get('SNAPSHOT_WATCH_INTERVAL', 0))
+app.config['PRELOAD'] = os.environ.get('DASHBOARD_PRELOAD') == '1'
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+
+#forecast data, ratings for heatmap and neighborhood shapes, swapped as a whole when new data is published
+snapshots = SnapshotManager(app.config['DASHBOARD_DATA_DIR'])
+
+#colors for the heatmap, green for low ratings to red for high ratings
+linear = cm.linear.RdYlGn_06
+
+#heatmap colors sampled once, ratings are sent to the browser as indexes into it
+palette = build_palette(linear)
+
+#hash of the code and templates rendering the pages, computed once so a deploy that changes them without new data doesn't serve old renders
+build_hash = build_version([os.path.join(app.root_path, 'app.py'), os.path.join(app.root_path, 'src'),
+                            os.path.join(app.root_path, app.template_folder)])
+
+#rendered maps keyed by data version and date index, sized with MAP_CACHE_SIZE and optionally kept on disk in MAP_CACHE_DIR under the build
+map_cache = MapCache(maxsize=app.config['MAP_CACHE_SIZE'], cache_dir=app.config['MAP_CACHE_DIR'], build=build_hash)
+
+#gzip and brotli bodies of rendered outputs, keyed by data version, build, route and date
+compressed_cache = CompressedCache(maxsize=app.config['COMPRESSED_CACHE_SIZE'])
+
+
+def invalidate_caches(old, new):
+    """Drops renders of the old snapshot once a new one is swapped in."""
+    map_cache.clear()
+    compressed_cache.clear()
+    render_table.cache_clear()
+    neighborhood_colors.cache_clear()
+    period_colors.cache_clear()
+    render_period_table.cache_clear()
+
+snapshots.on_swap.append(invalidate_caches)
+
+#request latency by route, time spent in each phase of a render, response sizes and cache hit ratios for /metrics
+metrics = MetricsRegistry()
+request_latency = metrics.register(Histogram(
+    'dashboard_request_duration_seconds', 'Request latency by route.', ('route', 'method', 'status')))
+phase_latency = metrics.register(Histogram(
+    'dashboard_phase_duration_seconds', 'Time spent in a phase of building a response.', ('phase',)))
+response_size = metrics.register(Histogram(
+    'dashboard_response_bytes', 'Response body size by route.', ('route',), buckets=SIZE_BUCKETS))
+cache_hits, cache_misses, cache_hit_ratio = cache_stats_gauges({
+    'map': map_cache.stats,
+    'compressed': compressed_cache.stats,
+    'table': lambda: render_table.cache_info()._asdict(),
+    'colors': lambda: neighborhood_colors.cache_info()._asdict(),
+})
+metrics.register(Gauges('dashboard_cache_hits', 'Cache hits since the snapshot was loaded.', ('cache',), cache_hits))
+metrics.register(Gauges('dashboard_cache_misses', 'Cache misses since the snapshot was loaded.', ('cache',), cache_misses))
+metrics.register(Gauges('dashboard_cache_hit_ratio', 'Share of cache lookups that were hits.', ('cache',), cache_hit_ratio))
+
+def start_snapshot_watch():
+    """Starts polling the data directory for new data when SNAPSHOT_WATCH_INTERVAL is set."""
+    if app.config['SNAPSHOT_WATCH_INTERVAL'] > 0:
+        snapshots.watch(app.config['SNAPSHOT_WATCH_INTERVAL'])
+
+#preloaded in a gunicorn master, each worker starts watching after the fork (see gunicorn.conf.py)
+if not app.config['PRELOAD']:
+    start_snapshot_watch()
+
+
+@app.before_request
+def use_current_snapshot():
+    #each request sticks to the snapshot it started with, even if a reload swaps in a new one
+    g.snapshot = snapshots.current
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_latency.observe(time.perf_counter() - g.request_start, route=route, method=request.method,
+                            status=response.status_code)
+    #streamed responses have no length up front and aren't counted
+    size = response.calculate_content_length()
+    if size is not None:
+        response_size.observe(size, route=route)
+    return response
+
+
+def parse_date(date_str, status=404):
+    """Converts a date string from the url to a date, returns 404 (or status) if it isn't a date."""
+    try:
+        return pd.to_datetime(date_str.replace('-', '/')).date()
+    except (ValueError, OverflowError):
+        abort(status)
+
+
+def lookup_date(date, date_index):
+    """Returns the row position for a date, returns 404 if there is no forecast for it."""
+    with phase_latency.time(phase='date_lookup'):
+        date_idx = date_index.get(date)
+    if date_idx is None:
+        abort(404)
+    return date_idx
+
+
+def render_page(template_name, **context):
+    """Renders a template, timing the render for /metrics."""
+    with phase_latency.time(phase='template_render'):
+        return render_template(template_name, **context)
+
+
+def serialize(dump):
+    """Calls a function building a response body, timing it for /metrics."""
+    with phase_latency.time(phase='serialization'):
+        return dump()
 
-#csv files with forecast data and ratings for heatmap
-city_predictions = pd.read_pickle('dashboard_data/city_predictions.pkl')
-neighborhood_ratings = pd.read_pickle('dashboard_data/neighborhood_ratings.pkl')
-neighborhood_predictions = pd.read_pickle('dashboard_data/neighborhood_predictions.pkl')
 
-with open('dashboard_data/seattle_neighborhood_shapes.geojson') as f:
-    mcpp_neighoborhoods = json.load(f)
+def precompressed_response(key, render, mimetype, max_age=0, shared=True):
+    """Sends a rendered output compressed for the client with a strong etag, 304 if the client has it.
+
+    Parameters
+    -----------
+    key: string identifying the rendered output within the snapshot
+    render: function returning the uncompressed body as bytes, only called when the body is needed
+    mimetype: mimetype of the body
+    max_age: seconds the client may reuse the response before revalidating it
+    shared: whether shared caches may keep the response, False for outputs of urls whose content
+        changes over time, such as the landing page showing today
+
+    Returns
+    --------
+    response
+    """
+    encoding = choose_encoding(request.accept_encodings)
+    version = g.snapshot.version + ':' + build_hash
+    response = app.response_class(mimetype=mimetype)
+    response.set_etag(make_etag(version, key, encoding))
+    response.vary.add('Accept-Encoding')
+    if shared:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    if request.if_none_match.contains(response.get_etag()[0]):
+        response.status_code = 304
+        return response
+    if encoding is None:
+        response.set_data(render())
+    else:
+        response.set_data(compressed_cache.get(version + ':' + key, encoding, render))
+        response.content_encoding = encoding
+    return response
+
+
+@app.errorhandler(404)
+def page_not_found(error):
+    return render_template('404.html'), 404
 
 
 @app.route('/') #landing page
 def settle_dv():
-    today = dt.date.today().strftime("%m/%d/%Y")
-    date_idx = (int((pd.to_datetime(neighborhood_ratings['date'])[pd.to_datetime(neighborhood_ratings['date'])==pd.to_datetime(today)].index).values))
-    mapping = map_seattle(date_idx)
-    i_frame = '<iframe src="/map/' + str(date_idx) + '" width="100%" height="595"> </iframe>'
-    return render_template('index.html', map=i_frame, table=render_table(today), date=today)
+    snapshot = g.snapshot
+    today = dt.date.today()
+    lookup_date(today, snapshot.date_index)
+    #the same url shows another day tomorrow, so only the browser keeps it
+    return precompressed_response('page:' + today.isoformat(), lambda: render_page(
+        'index.html', map=map_iframe(today), table=render_table(snapshot, today), date=today.strftime("%m/%d/%Y")).encode('utf-8'),
+        'text/html', shared=False)
 
 
 @app.route('/<date_str>', methods=['GET'])
 def query_date(date_str):
-    date_str = date_str.replace('-', '/')
-    date_idx = (int((pd.to_datetime(neighborhood_ratings['date'])[pd.to_datetime(neighborhood_ratings['date'])==pd.to_datetime(date_str)].index).values))
-    mapping = map_seattle(date_idx)
-    i_frame = '<iframe src="/map/' + str(date_idx) + '" width="100%" height="595"> </iframe>'
-    return render_template('index.html', map=i_frame, table=render_table(date_str), date=date_str)
+    snapshot = g.snapshot
+    date = parse_date(date_str)
+    lookup_date(date, snapshot.date_index)
+    return precompressed_response('page:' + date_str, lambda: render_page(
+        'index.html', map=map_iframe(date), table=render_table(snapshot, date), date=date_str.replace('-', '/')).encode('utf-8'),
+        'text/html')
     
 
-@app.route('/map/<date_idx>', methods=['GET'])
-def map(date_idx):
-    date_idx = int(date_idx)
-    return map_seattle(date_idx)
-
-def render_table(date_str):
-    date_idx = (int((pd.to_datetime(neighborhood_ratings['date'])[pd.to_datetime(neighborhood_ratings['date'])==pd.to_datetime(date_str)].index).values))
-    predictions = pd.concat([pd.DataFrame(neighborhood_predictions.iloc[date_idx]), neighborhood_predictions.mean()], axis=1).drop(labels='date').reset_index()
-    predictions.columns = ["neighborhood", "predicted_rate", "average_rate"]
-    output = []
-    for i in range(len(predictions)):
-        row = predictions.iloc[i]
-        output.append({'neighborhood' : row['neighborhood'],
-                    'predicted_rate' : row['predicted_rate'].round(decimals=2), 'average_rate': row['average_rate'].round(decimals=2)})
-    """populate table to display"""
-    table = render_template('table.html', rows = output)
-    return table
+@app.route('/period/<start_str>/<end_str>', methods=['GET'])
+def query_period(start_str, end_str):
+    #mean (default) or total predicted calls of the dates from start to end, both included
+    return period_page(parse_date(start_str), parse_date(end_str))
 
-def my_color_function(feature, date_idx):
-    """Maps low values to green and hugh values to red."""
+
+@app.route('/week/<date_str>', methods=['GET'])
+def query_week(date_str):
+    #monday to sunday of the week of the date
+    date = parse_date(date_str)
+    monday = date - dt.timedelta(days=date.weekday())
+    return period_page(monday, monday + dt.timedelta(days=6))
+
+
+@app.route('/month/<month_str>', methods=['GET'])
+def query_month(month_str):
+    #month as yyyy-mm
     try:
-        rating = neighborhood_ratings.iloc[date_idx][feature['properties']['name']]
-        return rating
+        month = dt.datetime.strptime(month_str, '%Y-%m').date()
+    except ValueError:
+        abort(404)
+    return period_page(month, month.replace(day=calendar.monthrange(month.year, month.month)[1]))
+
+
+def period_page(start, end):
+    """Renders the map and table of the forecasts between two dates, 404 if there are none."""
+    snapshot = g.snapshot
+    how = request.args.get('how', 'mean')
+    if how not in ['mean', 'total']:
+        abort(400)
+    #?animate=1 plays the map day by day instead of coloring it by the period
+    animate = bool(request.args.get('animate'))
+    rows = period_rows(snapshot, start, end)
+    first, last = [date.astype(object) for date in snapshot.forecast_arrays.dates[[rows.start, rows.stop - 1]]]
+    label = first.strftime('%m/%d/%Y') + ' - ' + last.strftime('%m/%d/%Y')
+    key = 'period:' + how + (':animate' if animate else '') + ':' + first.isoformat() + ':' + last.isoformat()
+    return precompressed_response(key, lambda: render_page(
+        'index.html', map=map_iframe(first, last, animate), table=render_period_table(snapshot, rows.start, rows.stop, how), date=label).encode('utf-8'),
+        'text/html')
+
+
+def period_rows(snapshot, start, end):
+    """Returns the slice of forecast dates between two dates, returns 404 if it's empty."""
+    with phase_latency.time(phase='date_lookup'):
+        rows = snapshot.forecast_arrays.date_slice(start, end)
+    if rows.stop <= rows.start:
+        abort(404)
+    return rows
+
+
+def map_iframe(date, end=None, animate=False):
+    """Returns the iframe for the base map page that colors neighborhoods for a date, or a range of dates up to end."""
+    if end is not None:
+        query = 'start=' + date.isoformat() + '&end=' + end.isoformat() + ('&animate=1' if animate else '')
+    else:
+        query = 'date=' + date.isoformat()
+    return '<iframe src="/basemap/?' + query + '" width="100%" height="595"> </iframe>'
+
+
+@app.route('/basemap/', methods=['GET'])
+def basemap():
+    #same page for every date, the date is read from the query string in the browser
+    #it names the geometry of the snapshot, so it's revalidated by etag instead of kept for a day
+    return precompressed_response('basemap', lambda: render_basemap().encode('utf-8'), 'text/html')
+
+
+def render_basemap(colors_suffix=''):
+    """Renders the base map page, colors_suffix is added to the color urls, e.g. '.json' for the static export.
+
+    Geometry urls carry the snapshot version, so geometry kept by browsers and CDNs for a day
+    is never drawn with the colors of another snapshot's neighborhoods.
+    """
+    versioned = '?v=' + g.snapshot.version
+    geometry_levels = [dict(level, url=level['url'] + versioned) for level in g.snapshot.geometry_levels]
+    return render_page('map.html', geometry_url='/geometry/seattle_neighborhood_shapes.geojson' + versioned,
+                       geometry_levels=geometry_levels, default_color=palette[MISSING_COLOR],
+                       colors_suffix=colors_suffix, frame_interval=500)
+
+
+@app.route('/geometry/<filename>', methods=['GET'])
+def geometry(filename):
+    data_dir = g.snapshot.data_dir
+    if filename == 'seattle_neighborhood_shapes.geojson':
+        path, mimetype = os.path.join(data_dir, filename), 'application/geo+json'
+    elif filename in [os.path.basename(level['url']) for level in g.snapshot.geometry_levels]:
+        path, mimetype = os.path.join(data_dir, 'geometry', filename), 'application/json'
+    else:
+        abort(404)
+    return precompressed_response('geometry:' + filename, lambda: read_file(path), mimetype,
+                                  max_age=app.config['GEOMETRY_MAX_AGE'])
+
+
+def read_file(path):
+    """Returns the bytes of a file."""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@app.route('/api/colors/<date_str>', methods=['GET'])
+def api_colors(date_str):
+    date = parse_date(date_str)
+    date_idx = lookup_date(date, g.snapshot.date_index)
+    ratings, colors = neighborhood_colors(g.snapshot, date_idx)
+    return precompressed_response('colors:' + date.isoformat(), lambda: serialize(lambda: json.dumps(
+        {'date': date.isoformat(), 'ratings': ratings, 'colors': colors}).encode('utf-8')), 'application/json')
+
+
+@app.route('/api/frames/<start_str>/<end_str>', methods=['GET'])
+def api_frames(start_str, end_str):
+    """Returns the colors of every date from start to end for animating the map.
+
+    'frames' is a base64 encoded uint8 matrix (dates x neighborhoods, row-major) of indexes
+    into 'palette', with neighborhoods in map feature order.
+    """
+    snapshot = g.snapshot
+    rows = period_rows(snapshot, parse_date(start_str), parse_date(end_str))
+    dates = snapshot.forecast_arrays.dates[rows].astype(str)
+
+    def render():
+        frames = snapshot.feature_colors[rows]
+        return json.dumps({'dates': dates.tolist(), 'neighborhoods': snapshot.feature_names, 'palette': palette,
+                           'frames': base64.b64encode(frames.tobytes()).decode('ascii')}).encode('utf-8')
+
+    return precompressed_response('frames:' + dates[0] + ':' + dates[-1], lambda: serialize(render), 'application/json')
+
+
+@app.route('/api/colors/<start_str>/<end_str>', methods=['GET'])
+def api_period_colors(start_str, end_str):
+    rows = period_rows(g.snapshot, parse_date(start_str), parse_date(end_str))
+    ratings, colors = period_colors(g.snapshot, rows.start, rows.stop)
+    dates = g.snapshot.forecast_arrays.dates
+    start, end = dates[rows.start].astype(str), dates[rows.stop - 1].astype(str)
+    return precompressed_response('colors:' + start + ':' + end, lambda: serialize(lambda: json.dumps(
+        {'start': start, 'end': end, 'ratings': ratings, 'colors': colors}).encode('utf-8')), 'application/json')
+
+
+@lru_cache(maxsize=1024)
+def neighborhood_colors(snapshot, date_idx):
+    """Returns the rating and fill color of every neighborhood on the map for a date index."""
+    return rating_colors(snapshot, snapshot.feature_ratings[date_idx], snapshot.feature_colors[date_idx])
+
+
+@lru_cache(maxsize=1024)
+def period_colors(snapshot, start_idx, stop_idx):
+    """Returns the rating and fill color of every neighborhood on the map for a range of date indexes."""
+    ratings = snapshot.by_feature(snapshot.forecast_arrays.period(slice(start_idx, stop_idx))['ratings'])
+    return rating_colors(snapshot, ratings, color_indexes(ratings))
+
+
+def rating_colors(snapshot, ratings, indexes):
+    """Returns dictionaries of the rating and fill color of every neighborhood on the map.
+
+    Parameters
+    -----------
+    snapshot: DashboardSnapshot
+    ratings: array of ratings in map feature order
+    indexes: array of palette indexes in map feature order
+    """
+    colors = np.array(palette, dtype=object)[indexes]
+    return dict(zip(snapshot.feature_names, ratings.tolist())), dict(zip(snapshot.feature_names, colors.tolist()))
+
+
+@app.route('/map/<int:row>', methods=['GET'])
+def map(row):
+    #the index is a row of the notebook's ratings dataframe, what links to maps have always pointed at
+    snapshot = g.snapshot
+    rating_rows = snapshot.forecast_arrays.rating_rows
+    if row >= len(rating_rows) or rating_rows[row] < 0:
+        abort(404)
+    date_idx = int(rating_rows[row])
+    return precompressed_response('map:' + str(date_idx), lambda: map_cache.get(
+        snapshot.version, date_idx, lambda: map_seattle(snapshot, date_idx)), 'text/html')
+
+
+@app.route('/table/<date_str>', methods=['GET'])
+def query_table(date_str):
+    snapshot = g.snapshot
+    date = parse_date(date_str)
+    lookup_date(date, snapshot.date_index)
+    return precompressed_response('table:' + date.isoformat(), lambda: render_table(snapshot, date).encode('utf-8'), 'text/html')
+
+
+@app.route('/api/predictions', methods=['GET'])
+def api_predictions():
+    """Returns predictions, ratings and city totals for a date range as columnar json or long csv.
+
+    Query parameters: start and end dates (inclusive), comma separated neighborhoods,
+    comma separated fields (the metric parameter) from predictions, ratings and city, and format json or csv.
+    """
+    start = parse_date(request.args['start'], status=400) if request.args.get('start') else None
+    end = parse_date(request.args['end'], status=400) if request.args.get('end') else None
+    fields = request.args.get('metric', 'predictions,ratings,city').split(',')
+    output_format = request.args.get('format', 'json')
+    if not set(fields) <= {'predictions', 'ratings', 'city'} or output_format not in ['json', 'csv']:
+        abort(400)
+    neighborhoods = request.args['neighborhoods'].split(',') if request.args.get('neighborhoods') else None
+    forecast_arrays = g.snapshot.forecast_arrays
+    try:
+        columns = forecast_arrays.neighborhood_positions(neighborhoods)
     except KeyError:
-        return 0.5
+        abort(400)
+    neighborhoods = [forecast_arrays.neighborhoods[i] for i in columns]
+
+    rows = forecast_arrays.date_slice(start, end)
+    selected = forecast_arrays.select(rows, columns, fields)
+    chunks = (json_chunks if output_format == 'json' else csv_chunks)(
+        selected, neighborhoods, chunk_size=app.config['API_STREAM_DAYS'])
+    mimetype = 'application/json' if output_format == 'json' else 'text/csv'
+    if rows.stop - rows.start > app.config['API_STREAM_DAYS']:
+        #large ranges are sent as they're formatted instead of building the whole body
+        return Response(stream_with_context(chunks), mimetype=mimetype)
+    return Response(serialize(lambda: ''.join(chunks)), mimetype=mimetype)
+
+
+@app.route('/api/locate', methods=['GET'])
+def api_locate():
+    """Returns the neighborhood of a point and its forecast for a date (today by default).
+
+    Query parameters: lat, lon and an optional date.
+    """
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+    except (KeyError, ValueError):
+        abort(400)
+    located = locate_points([lat], [lon], request.args.get('date'))
+    return jsonify({'lat': lat, 'lon': lon, **{field: values if field == 'date' else values[0]
+                                               for field, values in located.items()}})
 
-def map_seattle(date_idx):
+
+@app.route('/api/locate', methods=['POST'])
+def api_locate_bulk():
+    """Returns the neighborhoods of many points and their forecasts for a date (today by default).
+
+    Body: json object with 'points', a list of [lat, lon] pairs, and an optional 'date'.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+    try:
+        points = np.asarray(body.get('points'), dtype=np.float64).reshape(-1, 2)
+    except (TypeError, ValueError):
+        abort(400)
+    if len(points) > app.config['LOCATE_MAX_POINTS']:
+        abort(413)
+    located = locate_points(points[:, 0], points[:, 1], body.get('date'))
+    return Response(serialize(lambda: json.dumps(located)), mimetype='application/json')
+
+
+def locate_points(lat, lon, date_str=None):
+    """Finds the neighborhoods of points and their forecasts for a date.
+
+    Parameters
+    -----------
+    lat: array of latitudes
+    lon: array of longitudes
+    date_str: date of the forecasts, None for today
+
+    Returns
+    --------
+    dictionary of 'neighborhood' names (None outside Seattle), and when the date is forecast, the
+    'date' and 'prediction', 'rating' and 'average' lists (None for neighborhoods without forecasts)
+    """
+    snapshot = g.snapshot
+    forecast_arrays = snapshot.forecast_arrays
+    with phase_latency.time(phase='locate'):
+        features = snapshot.spatial_index.locate(lon, lat)
+    names = np.array(snapshot.feature_names + [None], dtype=object)[features]
+    located = {'neighborhood': names.tolist()}
+
+    date = parse_date(date_str, status=400) if date_str else dt.date.today()
+    date_idx = snapshot.date_index.get(date)
+    if date_idx is None:
+        return located
+    #forecast column of each point, -1 for points outside Seattle or in features without forecasts
+    columns = np.append(snapshot.feature_columns, -1)[features]
+    has_forecast = columns >= 0
+    located['date'] = date.isoformat()
+    for field, values in [('prediction', forecast_arrays.predictions[date_idx]),
+                          ('rating', forecast_arrays.ratings[date_idx]),
+                          ('average', snapshot.table_averages)]:
+        column = np.full(len(columns), None, dtype=object)
+        column[has_forecast] = np.asarray(values, dtype=np.float64)[columns[has_forecast]].tolist()
+        located[field] = column.tolist()
+    return located
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'snapshot': g.snapshot.version, 'map_cache': map_cache.stats(),
+                    'compressed_cache': compressed_cache.stats()})
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    #disabled unless ADMIN_TOKEN is configured
+    if not app.config['ADMIN_TOKEN']:
+        abort(404)
+    if request.headers.get('X-Admin-Token') != app.config['ADMIN_TOKEN']:
+        abort(403)
+    snapshots.reload_in_background()
+    return jsonify({'status': 'reloading', 'snapshot': g.snapshot.version}), 202
+
+
+@lru_cache(maxsize=1024)
+def render_table(snapshot, date):
+    """Renders the table of predicted and average rates by neighborhood for a date, memoized by snapshot and date."""
+    date_idx = lookup_date(date, snapshot.date_index)
+    predicted_rates = np.round(snapshot.forecast_arrays.predictions[date_idx].astype(np.float64), decimals=2)
+    output = [{'neighborhood': neighborhood, 'predicted_rate': predicted_rate, 'average_rate': average_rate}
+              for neighborhood, predicted_rate, average_rate
+              in zip(snapshot.table_neighborhoods, predicted_rates, snapshot.table_averages)]
+    """populate table to display"""
+    table = render_page('table.html', rows = output)
+    return table
+
+@lru_cache(maxsize=1024)
+def render_period_table(snapshot, start_idx, stop_idx, how):
+    """Renders the table of mean or total predicted rates by neighborhood for a range of date indexes."""
+    period = snapshot.forecast_arrays.period(slice(start_idx, stop_idx))
+    if how == 'total':
+        predicted_rates = np.round(period['totals'], decimals=2)
+        average_rates = np.round(snapshot.forecast_arrays.prediction_means * period['days'], decimals=2)
+    else:
+        predicted_rates = np.round(period['means'], decimals=2)
+        average_rates = snapshot.table_averages
+    output = [{'neighborhood': neighborhood, 'predicted_rate': predicted_rate, 'average_rate': average_rate}
+              for neighborhood, predicted_rate, average_rate
+              in zip(snapshot.table_neighborhoods, predicted_rates, average_rates)]
+    return render_page('table.html', rows = output)
+
+#folium style of each palette color, a feature's style is looked up by its color index
+palette_styles = [{'fillColor': color, 'fillOpacity': 0.45, 'color': 'gray', 'dashArray': '2, 5'} for color in palette]
+
+def map_seattle(snapshot, date_idx):
     date_idx = int(date_idx)
-    linear = cm.linear.RdYlGn_06
-    seattle_neighborhoods = folium.Map(location=[47.61, -122.3321],
-                                       zoom_start=11,tiles='cartodbpositron')
-    
-    GeoJson(mcpp_neighoborhoods,
-        style_function=lambda feature: {
-        'fillColor': linear(my_color_function(feature, date_idx)),
-        'fillOpacity': 0.45,
-        'color': 'gray',
-        'dashArray': '2, 5'}).add_to(seattle_neighborhoods)
-    
-    mapdata = BytesIO()
-    seattle_neighborhoods.save(mapdata, close_file=False)
+    styles = dict(zip(snapshot.feature_names,
+                      [palette_styles[index] for index in snapshot.feature_colors[date_idx].tolist()]))
+    #folium applies the styles when the map is saved, so the whole render counts as the map build
+    with phase_latency.time(phase='map_build'):
+        seattle_neighborhoods = folium.Map(location=[47.61, -122.3321],
+                                           zoom_start=11,tiles='cartodbpositron')
+
+        GeoJson(snapshot.neighborhood_shapes(),
+            style_function=lambda feature: styles[feature['properties']['name']]).add_to(seattle_neighborhoods)
+
+        mapdata = BytesIO()
+        seattle_neighborhoods.save(mapdata, close_file=False)
     html = mapdata.getvalue()
-    return html
\ No newline at end of file
+    return html
+
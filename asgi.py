@@ -0,0 +1,23 @@
+import os
+
+from app import app, snapshots, metrics
+from src.asgi_bridge import WsgiBridge
+from src.metrics import Gauges
+
+#serve with an ASGI server, e.g. `uvicorn asgi:application`; routes and templates are the ones in app.py
+app.config['ASGI_RENDER_THREADS'] = int(os.environ.get('ASGI_RENDER_THREADS', 4))
+app.config['ASGI_MAX_PENDING'] = int(os.environ.get('ASGI_MAX_PENDING', 64))
+app.config['ASGI_CACHE_SIZE'] = int(os.environ.get('ASGI_CACHE_SIZE', 256))
+
+#renders run on a bounded thread pool, repeat requests for cached pages and maps are answered on the event loop
+application = WsgiBridge(app, lambda: snapshots.current.version,
+                         max_workers=app.config['ASGI_RENDER_THREADS'],
+                         max_pending=app.config['ASGI_MAX_PENDING'],
+                         cache_size=app.config['ASGI_CACHE_SIZE'])
+
+metrics.register(Gauges('dashboard_asgi_cache_hit_ratio', 'Share of requests answered on the event loop.', (),
+                        lambda: [((), application.stats()['hit_ratio'])]))
+metrics.register(Gauges('dashboard_asgi_pending_requests', 'Requests waiting for or running on the render pool.', (),
+                        lambda: [((), application.stats()['pending'])]))
+metrics.register(Gauges('dashboard_asgi_rejected_requests', 'Requests answered 503 because the render pool was full.', (),
+                        lambda: [((), application.stats()['rejected'])]))
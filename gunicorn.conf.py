@@ -0,0 +1,30 @@
+import gc
+import os
+
+#load app.py and the dashboard data once in the master, forked workers share those pages copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+if preload_app:
+    os.environ['DASHBOARD_PRELOAD'] = '1'
+    #no collections while the app loads, collected objects would leave holes in shared pages
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    #moves everything loaded so far out of the collector, so collections in workers never write to those objects
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+        from app import start_snapshot_watch
+        start_snapshot_watch()
+
+
+def when_ready(server):
+    if preload_app:
+        gc.enable()
@@ -0,0 +1,269 @@
+import io
+import sys
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import ResponseCacheControl
+from werkzeug.http import parse_accept_header, parse_cache_control_header, parse_etags, unquote_etag
+
+from src.compressed_responses import choose_encoding
+
+
+# headers sent again with a 304 answered from the response cache
+NOT_MODIFIED_HEADERS = {b"etag", b"cache-control", b"vary", b"expires", b"date"}
+
+
+def build_environ(scope, body):
+    """Creates the WSGI environ of an ASGI http request.
+
+    Parameters
+    -----------
+    scope: dictionary of the ASGI connection scope
+    body: bytes of the request body
+
+    Returns
+    --------
+    dictionary
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": str(client[0]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+            continue
+        key = "HTTP_" + name
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+def shareable(headers):
+    """Checks whether a response may be kept by a shared cache, i.e. isn't marked private or no-store.
+
+    Parameters
+    -----------
+    headers: list of (name, value) byte string pairs with lowercase names
+
+    Returns
+    --------
+    boolean
+    """
+    value = b",".join(value for name, value in headers if name == b"cache-control").decode("latin-1")
+    cache_control = parse_cache_control_header(value, cls=ResponseCacheControl)
+    return not cache_control.private and not cache_control.no_store
+
+
+class WsgiBridge:
+    """ASGI application serving a WSGI app, with CPU-heavy work kept off the event loop.
+
+    Every request that isn't cached runs the WSGI app on a bounded thread pool, so a slow
+    render holds a worker thread instead of the event loop. GET responses carrying a strong
+    ETag and a length are kept in a bounded cache keyed by data version, path and content
+    encoding, and repeat requests for them (including conditional requests answered with 304)
+    are served on the event loop without touching the pool. The cache is shared by every
+    client, so it honors Cache-Control like a shared cache: responses marked private or
+    no-store, such as pages that depend on the current date, always go to the WSGI app.
+    Responses served from the cache don't pass through the WSGI app, so its request hooks
+    don't see them.
+
+    Attributes
+    -----------
+    wsgi_app: WSGI application
+    version: function returning the current data version, cached responses of older versions are dropped
+    max_workers: number of threads rendering responses
+    max_pending: number of requests waiting for or running on the pool before answering 503
+    cache_size: maximum number of responses cached for the event loop
+    hits: number of requests answered from the cache
+    misses: number of requests sent to the pool
+    rejected: number of requests answered 503 because the pool was saturated
+    """
+
+    def __init__(self, wsgi_app, version, max_workers=4, max_pending=64, cache_size=256):
+        """The constructor for WsgiBridge class.
+
+        Parameters
+        -----------
+        wsgi_app: WSGI application
+        version: function returning the current data version
+        max_workers: number of threads rendering responses
+        max_pending: number of requests waiting for or running on the pool before answering 503
+        cache_size: maximum number of responses cached for the event loop
+        """
+        self.wsgi_app = wsgi_app
+        self.version = version
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asgi-render")
+        self._pending = 0
+        self._responses = OrderedDict()
+        self._cache_version = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        """Answers the server's startup and shutdown messages, stopping the pool on shutdown."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        """Serves an http request from the cache, or from the WSGI app on the pool."""
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        headers = {}
+        for name, value in scope.get("headers", []):
+            headers.setdefault(name.lower(), value.decode("latin-1"))
+        key = None
+        if scope["method"] == "GET":
+            encoding = choose_encoding(parse_accept_header(headers.get(b"accept-encoding", "")))
+            key = (scope["path"], scope.get("query_string", b""), encoding)
+            cached = self._cached(key)
+            if cached is not None:
+                self.hits += 1
+                await self._send_cached(cached, headers.get(b"if-none-match"), send)
+                return
+
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"text/plain"), (b"retry-after", b"1")]})
+            await send({"type": "http.response.body", "body": b"Service Unavailable"})
+            return
+
+        self.misses += 1
+        self._pending += 1
+        try:
+            await self._run_wsgi(scope, body, key, send)
+        finally:
+            self._pending -= 1
+
+    async def _run_wsgi(self, scope, body, key, send):
+        """Runs the WSGI app on the pool and sends its response, caching it when it can be."""
+        loop = asyncio.get_running_loop()
+        version = self.version()
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                   for name, value in response_headers]
+
+        def call():
+            iterable = self.wsgi_app(build_environ(scope, body), start_response)
+            return iterable, iter(iterable)
+
+        iterable, chunks = await loop.run_in_executor(self._executor, call)
+        try:
+            first = await loop.run_in_executor(self._executor, next, chunks, None)
+            await send({"type": "http.response.start", "status": response["status"],
+                        "headers": response["headers"]})
+            # streamed responses have no length and aren't kept
+            names = {name for name, value in response["headers"]}
+            cacheable = (key is not None and response["status"] == 200 and {b"etag", b"content-length"} <= names
+                         and shareable(response["headers"]))
+            parts = []
+            chunk = first
+            while chunk is not None:
+                if cacheable:
+                    parts.append(chunk)
+                following = await loop.run_in_executor(self._executor, next, chunks, None)
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": following is not None})
+                chunk = following
+            if first is None:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(iterable, "close"):
+                await loop.run_in_executor(self._executor, iterable.close)
+
+        if cacheable:
+            self._store(version, key, (response["headers"], b"".join(parts)))
+
+    def _cached(self, key):
+        """Returns the cached headers and body of a request, None if it isn't cached."""
+        version = self.version()
+        if version != self._cache_version:
+            self._responses.clear()
+            self._cache_version = version
+            return None
+        cached = self._responses.get(key)
+        if cached is not None:
+            self._responses.move_to_end(key)
+        return cached
+
+    def _store(self, version, key, cached):
+        """Adds a response to the cache, evicting the least recently used past cache_size."""
+        if self.cache_size <= 0 or version != self.version():
+            return
+        if version != self._cache_version:
+            self._responses.clear()
+            self._cache_version = version
+        self._responses[key] = cached
+        while len(self._responses) > self.cache_size:
+            self._responses.popitem(last=False)
+
+    async def _send_cached(self, cached, if_none_match, send):
+        """Sends a cached response, or a 304 when the client already has it."""
+        headers, body = cached
+        etag = dict(headers)[b"etag"].decode("latin-1")
+        if if_none_match and parse_etags(if_none_match).contains(unquote_etag(etag)[0]):
+            await send({"type": "http.response.start", "status": 304,
+                        "headers": [(name, value) for name, value in headers if name in NOT_MODIFIED_HEADERS]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def stats(self):
+        """Returns a dictionary of cache and pool counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._responses),
+            "maxsize": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "rejected": self.rejected,
+            "pending": self._pending,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+        }
@@ -0,0 +1,92 @@
+import calendar
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# span of days covered by the calendar table
+CALENDAR_START = np.datetime64("2009-01-01", "D")
+CALENDAR_END = np.datetime64("2030-12-31", "D")
+
+# first day of each month of a leap year as a day of the year starting at 0
+_MONTH_STARTS = np.cumsum([0] + [calendar.monthrange(2020, month)[1] for month in range(1, 12)])
+
+# values of the month_day and month_weekday features, addressed by their codes
+MONTH_DAYS = np.array(
+    [f"{month:02d}/{day:02d}" for month in range(1, 13) for day in range(1, calendar.monthrange(2020, month)[1] + 1)],
+    dtype=object,
+)
+MONTH_WEEKDAYS = np.array(
+    [f"{calendar.month_abbr[month]}_{calendar.day_abbr[weekday]}" for month in range(1, 13) for weekday in range(7)],
+    dtype=object,
+)
+
+
+@lru_cache(maxsize=None)
+def calendar_table():
+    """Returns the date features of every day from CALENDAR_START to CALENDAR_END.
+
+    The table is built once per process. Rows are addressed by day offset from
+    CALENDAR_START, and month_day and month_weekday are stored as codes into MONTH_DAYS
+    and MONTH_WEEKDAYS.
+
+    Returns
+    --------
+    dataframe with dt_time, date, year, month, day, day_of_week, month_day and month_weekday columns
+    """
+    index = pd.DatetimeIndex(np.arange(CALENDAR_START, CALENDAR_END + 1))
+    month = index.month.values.astype(np.int8)
+    day = index.day.values.astype(np.int8)
+    weekday = index.weekday.values.astype(np.int8)
+    return pd.DataFrame(
+        {
+            "dt_time": index,
+            "date": index.date,
+            "year": index.year.values.astype(np.int16),
+            "month": month,
+            "day": day,
+            "day_of_week": weekday,
+            "month_day": (_MONTH_STARTS[month - 1] + day - 1).astype(np.int16),
+            "month_weekday": ((month - 1) * 7 + weekday).astype(np.int8),
+        }
+    )
+
+
+def day_offsets(dates):
+    """Returns the rows of the calendar table of dates.
+
+    Parameters
+    -----------
+    dates: array-like of datetime.date, datetime64 or date strings
+
+    Returns
+    --------
+    int64 array of day offsets from CALENDAR_START
+    """
+    days = pd.to_datetime(pd.Index(dates)).values.astype("datetime64[D]")
+    if len(days) and (days.min() < CALENDAR_START or days.max() > CALENDAR_END):
+        raise ValueError(
+            f"Dates from {days.min()} to {days.max()} are outside the calendar table "
+            f"({CALENDAR_START} to {CALENDAR_END})"
+        )
+    return (days - CALENDAR_START).astype(np.int64)
+
+
+def calendar_features(offsets):
+    """Returns the date features of days of the calendar table.
+
+    month_day and month_weekday are decoded into their strings by indexing the value arrays.
+
+    Parameters
+    -----------
+    offsets: integer array of day offsets from CALENDAR_START
+
+    Returns
+    --------
+    dataframe with dt_time, date, year, month, day, day_of_week, month_day and month_weekday columns
+    """
+    features = calendar_table().take(offsets).reset_index(drop=True)
+    features["month_day"] = MONTH_DAYS[features["month_day"].values]
+    features["month_weekday"] = MONTH_WEEKDAYS[features["month_weekday"].values]
+    return features
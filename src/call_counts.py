@@ -0,0 +1,346 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+# columns of the Calls for Service export used for counting
+CALL_COLUMNS = ["NEIGHBORHOOD", "ORIG_TIME_QUEUED", "EVENT"]
+
+# arrays are saved under the version of the counts, the state names the current ones
+COUNTS_FILE = "call_counts-{version}.npy"
+CITY_FILE = "call_counts_city-{version}.npy"
+STATE_FILE = "call_counts.json"
+
+
+def counted_calls(calls):
+    """Parses the time queued of calls for service and finds the calls that are counted.
+
+    Calls without a time queued or event aren't counted. Calls without a neighborhood are
+    counted for the city only.
+
+    Parameters
+    -----------
+    calls: dataframe with NEIGHBORHOOD, ORIG_TIME_QUEUED and EVENT columns
+
+    Returns
+    --------
+    tuple: datetime64 array of the time each call was queued, boolean array of the calls counted
+    """
+    times = pd.to_datetime(calls["ORIG_TIME_QUEUED"]).values
+    counted = calls["EVENT"].notna().values & ~np.isnat(times)
+    return times, counted
+
+
+class CallCounts:
+    """Dense counts of calls for service by day and neighborhood.
+
+    Neighborhoods and days are factorized to integers and every call is counted into a
+    days x neighborhoods int32 array in a single bincount pass, so days without calls in a
+    neighborhood are zeros of the array rather than rows added by a merge. Calls without a
+    neighborhood aren't in the array, so the city total of each day is kept alongside it.
+
+    Attributes
+    -----------
+    start: numpy datetime64[D] of the first day counted
+    neighborhoods: sorted list of neighborhood names
+    counts: int32 array (days x neighborhoods) of the number of calls
+    city: int32 array of the number of calls each day, including calls without a neighborhood
+    """
+
+    def __init__(self, start, neighborhoods, counts, city=None):
+        """The constructor for CallCounts class.
+
+        Parameters
+        -----------
+        start: numpy datetime64[D], datetime.date or string of the first day counted
+        neighborhoods: sorted list of neighborhood names
+        counts: array (days x neighborhoods) of the number of calls
+        city: array of the number of calls each day, defaults to the sum of the neighborhoods
+        """
+        self.start = np.datetime64(start, "D")
+        self.neighborhoods = list(neighborhoods)
+        self.counts = np.asarray(counts, dtype=np.int32).reshape(len(counts), len(self.neighborhoods))
+        self.city = self.counts.sum(axis=1, dtype=np.int32) if city is None else np.asarray(city, dtype=np.int32)
+
+    @classmethod
+    def empty(cls, neighborhoods=()):
+        """Returns counts of no days."""
+        return cls(np.datetime64("NaT", "D"), neighborhoods, np.zeros((0, len(neighborhoods))))
+
+    @classmethod
+    def from_calls(cls, calls):
+        """Counts a dataframe of calls for service.
+
+        Calls without a time queued or event aren't counted, and calls without a neighborhood
+        are only counted in the city totals.
+
+        Parameters
+        -----------
+        calls: dataframe with NEIGHBORHOOD, ORIG_TIME_QUEUED and EVENT columns
+
+        Returns
+        --------
+        CallCounts
+        """
+        times, counted = counted_calls(calls)
+        codes, neighborhoods = pd.factorize(calls["NEIGHBORHOOD"].values[counted], sort=True)
+        return cls.from_codes(times[counted].astype("datetime64[D]"), codes, list(neighborhoods))
+
+    @classmethod
+    def from_codes(cls, days, codes, neighborhoods):
+        """Counts calls given as days and neighborhood codes.
+
+        Parameters
+        -----------
+        days: datetime64[D] array of the day of each call
+        codes: integer array of the position of each call's neighborhood in neighborhoods, -1 for
+            calls without a neighborhood
+        neighborhoods: sorted list of neighborhood names
+
+        Returns
+        --------
+        CallCounts covering the first to the last day of the calls
+        """
+        days = np.asarray(days, dtype="datetime64[D]")
+        if len(days) == 0:
+            return cls.empty(neighborhoods)
+        start = days.min()
+        offsets = (days - start).astype(np.int64)
+        num_days = int(offsets.max()) + 1
+        codes = np.asarray(codes, dtype=np.int64)
+        located = codes >= 0
+        cells = offsets[located] * len(neighborhoods) + codes[located]
+        counts = np.bincount(cells, minlength=num_days * len(neighborhoods))
+        city = np.bincount(offsets, minlength=num_days)
+        return cls(start, neighborhoods, counts.reshape(num_days, len(neighborhoods)), city)
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """Counts calls arriving in chunks, holding only the counts between chunks.
+
+        Parameters
+        -----------
+        chunks: iterable of dataframes with NEIGHBORHOOD, ORIG_TIME_QUEUED and EVENT columns
+
+        Returns
+        --------
+        CallCounts
+        """
+        total = cls.empty()
+        for chunk in chunks:
+            total = total.add(cls.from_calls(chunk))
+        return total
+
+    def add(self, other):
+        """Adds two counts together.
+
+        Parameters
+        -----------
+        other: CallCounts
+
+        Returns
+        --------
+        CallCounts covering the days and neighborhoods of both
+        """
+        neighborhoods = sorted(set(self.neighborhoods) | set(other.neighborhoods))
+        positions = {name: i for i, name in enumerate(neighborhoods)}
+        parts = [part for part in (self, other) if len(part.counts)]
+        if not parts:
+            return CallCounts.empty(neighborhoods)
+        start = min(part.start for part in parts)
+        offsets = [int((part.start - start) // np.timedelta64(1, "D")) for part in parts]
+        num_days = max(offset + len(part.counts) for offset, part in zip(offsets, parts))
+        counts = np.zeros((num_days, len(neighborhoods)), dtype=np.int32)
+        city = np.zeros(num_days, dtype=np.int32)
+        for offset, part in zip(offsets, parts):
+            columns = [positions[name] for name in part.neighborhoods]
+            counts[offset : offset + len(part.counts), columns] += part.counts
+            city[offset : offset + len(part.counts)] += part.city
+        return CallCounts(start, neighborhoods, counts, city)
+
+    @property
+    def dates(self):
+        """Returns a datetime64[D] array of the days counted."""
+        return self.start + np.arange(len(self.counts))
+
+    def to_frame(self):
+        """Returns the long dataframe of calls per neighborhood per day.
+
+        Returns
+        --------
+        dataframe with date (datetime.date), neighborhood and num_calls columns, one row for
+        every day and neighborhood sorted by date then neighborhood
+        """
+        num_days, num_neighborhoods = self.counts.shape
+        return pd.DataFrame(
+            {
+                "date": np.repeat(pd.DatetimeIndex(self.dates).date, num_neighborhoods),
+                "neighborhood": np.tile(np.array(self.neighborhoods, dtype=object), num_days),
+                "num_calls": self.counts.ravel(),
+            }
+        )
+
+
+class CountStore:
+    """Call counts persisted between refreshes, updated with only the calls exported since.
+
+    The store keeps the day x neighborhood counts and a high-water mark, the latest time
+    queued counted. Calls queued after the high-water mark are added to the counts. An export
+    reaching back to the high-water mark, to pick up late-arriving or corrected records, covers
+    whole days from a given midnight, and those days are recounted from it, so the rest of the
+    history is untouched.
+
+    Attributes
+    -----------
+    directory: directory the store is saved in
+    counts: CallCounts of every call counted
+    high_water_mark: numpy datetime64 of the latest time queued counted, NaT for an empty store
+    """
+
+    def __init__(self, directory, counts=None, high_water_mark=None):
+        """The constructor for CountStore class.
+
+        Parameters
+        -----------
+        directory: directory the store is saved in
+        counts: CallCounts of every call counted
+        high_water_mark: numpy datetime64 or string of the latest time queued counted
+        """
+        self.directory = directory
+        self.counts = CallCounts.empty() if counts is None else counts
+        self.high_water_mark = np.datetime64("NaT", "s") if high_water_mark is None else np.datetime64(high_water_mark, "s")
+
+    @classmethod
+    def load(cls, directory):
+        """Loads the store saved in a directory, or an empty store if nothing has been saved there.
+
+        Parameters
+        -----------
+        directory: directory of the store
+
+        Returns
+        --------
+        CountStore
+        """
+        state_path = os.path.join(directory, STATE_FILE)
+        if not os.path.exists(state_path):
+            return cls(directory)
+        with open(state_path) as f:
+            state = json.load(f)
+        # stores saved before city totals were kept fall back to the sum of the neighborhoods
+        city = np.load(os.path.join(directory, state["city"])) if "city" in state else None
+        counts = CallCounts(
+            state["start"], state["neighborhoods"], np.load(os.path.join(directory, state["counts"])), city
+        )
+        return cls(directory, counts, state["high_water_mark"])
+
+    def save(self):
+        """Writes the counts and their state.
+
+        The arrays are written under names carrying a hash of their contents and the state
+        naming them is replaced last, so a crash leaves either the old state with its counts or
+        the new state with its counts, never new counts under the old high-water mark. Arrays of
+        the replaced state are removed afterwards.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        state_path = os.path.join(self.directory, STATE_FILE)
+        previous = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                previous = json.load(f)
+
+        digest = hashlib.sha1()
+        for values in [self.counts.counts, self.counts.city]:
+            digest.update(np.ascontiguousarray(values).tobytes())
+        digest.update(str(self.high_water_mark).encode("ascii"))
+        version = digest.hexdigest()[:12]
+        files = {"counts": COUNTS_FILE.format(version=version), "city": CITY_FILE.format(version=version)}
+        for name, values in [("counts", self.counts.counts), ("city", self.counts.city)]:
+            tmp_path = os.path.join(self.directory, files[name] + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, values)
+            os.replace(tmp_path, os.path.join(self.directory, files[name]))
+        state = {
+            "start": str(self.counts.start),
+            "neighborhoods": self.counts.neighborhoods,
+            "high_water_mark": str(self.high_water_mark),
+            **files,
+        }
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+        for name in ["counts", "city"]:
+            filename = previous.get(name)
+            if filename is not None and filename not in files.values():
+                path = os.path.join(self.directory, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def update(self, calls, window_start=None):
+        """Folds calls exported since the last update into the counts.
+
+        An export that reaches back to the high-water mark must cover whole days: window_start
+        is the midnight its window starts at, and every day from window_start to the day of the
+        high-water mark is recounted from the calls given for it. Days after the high-water
+        mark have the calls added to their counts. Corrections that move a call from a day
+        before the window to another day aren't handled, the call stays counted on its old day
+        as well.
+
+        Parameters
+        -----------
+        calls: dataframe, or iterable of dataframe chunks, of deduplicated calls with
+            NEIGHBORHOOD, ORIG_TIME_QUEUED and EVENT columns
+        window_start: numpy datetime64, datetime or string of the midnight the export starts at,
+            needed when it has calls queued at or before the high-water mark
+
+        Returns
+        --------
+        dictionary of the number of calls counted and the number of days recounted
+
+        Raises
+        --------
+        ValueError if the calls reach back to the high-water mark without a window_start, if
+        window_start isn't a midnight, or if a call was queued before window_start
+        """
+        if isinstance(calls, pd.DataFrame):
+            calls = [calls]
+        if window_start is not None:
+            window_start = np.datetime64(window_start, "s")
+            if window_start != window_start.astype("datetime64[D]"):
+                raise ValueError(f"The export window must start at midnight, not {window_start}")
+        new = CallCounts.empty()
+        latest = self.high_water_mark
+        for chunk in calls:
+            times, counted = counted_calls(chunk)
+            if window_start is not None and (times[counted] < window_start).any():
+                raise ValueError(f"The export has calls queued before its window start {window_start}")
+            late = not np.isnat(self.high_water_mark) and (times[counted] <= self.high_water_mark).any()
+            if late and window_start is None:
+                raise ValueError(
+                    "The export has calls queued at or before the high-water mark "
+                    f"{self.high_water_mark}, so the midnight its window starts at must be given"
+                )
+            if counted.any():
+                chunk_latest = times[counted].max().astype("datetime64[s]")
+                latest = chunk_latest if np.isnat(latest) else max(latest, chunk_latest)
+            new = new.add(CallCounts.from_calls(chunk))
+
+        counts = self.counts.counts.copy()
+        city = self.counts.city.copy()
+        recounted_days = 0
+        if window_start is not None and not np.isnat(self.high_water_mark) and len(counts):
+            # every day of the window up to the high-water mark is recounted, not only days with calls
+            first = (window_start.astype("datetime64[D]") - self.counts.start).astype(np.int64)
+            last = (self.high_water_mark.astype("datetime64[D]") - self.counts.start).astype(np.int64)
+            rows = slice(int(max(first, 0)), int(min(last + 1, len(counts))))
+            counts[rows] = 0
+            city[rows] = 0
+            recounted_days = max(rows.stop - rows.start, 0)
+        self.counts = CallCounts(self.counts.start, self.counts.neighborhoods, counts, city).add(new)
+        self.high_water_mark = latest
+        return {"calls": int(new.city.sum()), "recounted_days": recounted_days}
@@ -0,0 +1,157 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+CACHE_FILE = "calls_cache.json"
+
+# columns stored as int64 nanoseconds, every other column is dictionary-encoded
+TIME_COLUMNS = ["ORIG_TIME_QUEUED"]
+
+
+def file_hash(filepath, block_size=1 << 20):
+    """Returns the sha1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_cache_meta(cache_dir):
+    """Returns the sidecar of a calls cache, None if there is no cache."""
+    meta_path = os.path.join(cache_dir, CACHE_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def cache_is_current(cache_dir, filepath, columns):
+    """Checks whether a calls cache holds the columns of the current version of its source file.
+
+    The source is compared by size and mtime first. When only the mtime differs the file is
+    hashed, and an unchanged file has its new mtime recorded so it isn't hashed again.
+
+    Parameters
+    -----------
+    cache_dir: directory of the cache
+    filepath: location of the source csv file
+    columns: list of columns that are needed
+
+    Returns
+    --------
+    boolean
+    """
+    meta = read_cache_meta(cache_dir)
+    if meta is None or not set(columns) <= set(meta["columns"]):
+        return False
+    stat = os.stat(filepath)
+    source = meta["source"]
+    if stat.st_size != source["size"]:
+        return False
+    if stat.st_mtime_ns == source["mtime_ns"]:
+        return True
+    if file_hash(filepath) != source["sha1"]:
+        return False
+    source["mtime_ns"] = stat.st_mtime_ns
+    write_json(os.path.join(cache_dir, CACHE_FILE), meta)
+    return True
+
+
+def write_json(path, data):
+    """Writes json to a temporary file moved into place."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def write_calls_cache(cache_dir, filepath, chunks, columns):
+    """Converts chunks of calls into a typed columnar cache.
+
+    Each column is written as its own .npy file: times as int64 nanoseconds (NaT as the
+    int64 minimum) and other columns as int32 codes into a dictionary of values kept in the
+    json sidecar, with -1 for missing values. The sidecar is removed first and written last, and records the
+    size, mtime and hash of the source file.
+
+    Parameters
+    -----------
+    cache_dir: directory of the cache
+    filepath: location of the source csv file the chunks are read from
+    chunks: iterable of dataframes of deduplicated calls
+    columns: list of columns to store
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # an interrupted conversion leaves no sidecar, so it's never read as current
+    if os.path.exists(os.path.join(cache_dir, CACHE_FILE)):
+        os.remove(os.path.join(cache_dir, CACHE_FILE))
+    stat = os.stat(filepath)
+    source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": file_hash(filepath)}
+    parts = {column: [] for column in columns}
+    dictionaries = {column: {} for column in columns if column not in TIME_COLUMNS}
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        for column in columns:
+            if column in TIME_COLUMNS:
+                parts[column].append(pd.to_datetime(chunk[column]).values.astype("datetime64[ns]").view(np.int64))
+                continue
+            codes, values = pd.factorize(chunk[column])
+            dictionary = dictionaries[column]
+            mapping = np.array([dictionary.setdefault(value, len(dictionary)) for value in values] + [-1], dtype=np.int32)
+            parts[column].append(mapping[codes])
+
+    # dictionaries are sorted so categories compare and factorize like the strings they encode
+    sorted_dictionaries = {}
+    for column, dictionary in dictionaries.items():
+        values = sorted(dictionary)
+        recode = np.empty(len(values) + 1, dtype=np.int32)
+        recode[[dictionary[value] for value in values]] = np.arange(len(values))
+        recode[-1] = -1
+        parts[column] = [recode[codes] for codes in parts[column]]
+        sorted_dictionaries[column] = values
+
+    files = {}
+    for column in columns:
+        dtype = np.int64 if column in TIME_COLUMNS else np.int32
+        values = np.concatenate(parts[column]) if parts[column] else np.empty(0, dtype=dtype)
+        files[column] = column + ".npy"
+        tmp_path = os.path.join(cache_dir, files[column] + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, values.astype(dtype, copy=False))
+        os.replace(tmp_path, os.path.join(cache_dir, files[column]))
+    meta = {
+        "source": source,
+        "rows": rows,
+        "columns": list(columns),
+        "files": files,
+        "dictionaries": sorted_dictionaries,
+    }
+    write_json(os.path.join(cache_dir, CACHE_FILE), meta)
+
+
+def read_calls_cache(cache_dir, columns):
+    """Reads the projected columns of a calls cache.
+
+    Parameters
+    -----------
+    cache_dir: directory of the cache
+    columns: list of columns to read
+
+    Returns
+    --------
+    dataframe with datetime64 time columns and categorical dictionary-encoded columns
+    """
+    meta = read_cache_meta(cache_dir)
+    data = {}
+    for column in columns:
+        values = np.load(os.path.join(cache_dir, meta["files"][column]))
+        if column in TIME_COLUMNS:
+            data[column] = values.view("datetime64[ns]")
+        else:
+            data[column] = pd.Categorical.from_codes(values, categories=meta["dictionaries"][column])
+    return pd.DataFrame(data, columns=columns)
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+# number of colors ratings are quantized to, one more index is reserved for missing ratings
+PALETTE_LEVELS = 255
+MISSING_COLOR = PALETTE_LEVELS
+
+
+def build_palette(colormap, missing_rating=0.5):
+    """Samples a colormap into the palette addressed by color indexes.
+
+    Parameters
+    -----------
+    colormap: branca colormap over ratings from 0 to 1
+    missing_rating: rating whose color is used for neighborhoods without a rating
+
+    Returns
+    --------
+    list of PALETTE_LEVELS + 1 hex color strings
+    """
+    colors = [colormap.rgb_hex_str(level / (PALETTE_LEVELS - 1)) for level in range(PALETTE_LEVELS)]
+    return colors + [colormap.rgb_hex_str(missing_rating)]
+
+
+def color_indexes(ratings):
+    """Quantizes ratings to palette indexes, ratings outside 0 to 1 take the end colors.
+
+    Parameters
+    -----------
+    ratings: array of ratings, NaN where there is no rating
+
+    Returns
+    --------
+    uint8 array of the same shape
+    """
+    ratings = np.asarray(ratings, dtype=np.float64)
+    indexes = np.rint(np.clip(ratings, 0.0, 1.0) * (PALETTE_LEVELS - 1))
+    indexes[np.isnan(ratings)] = MISSING_COLOR
+    return indexes.astype(np.uint8)
@@ -0,0 +1,180 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# content encodings in order of preference, brotli only when the brotli package is installed
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+# compression levels for bodies compressed while a request waits, fast enough not to outweigh the render
+ON_DEMAND_LEVELS = {"br": 5, "gzip": 6}
+
+# compression levels for bodies compressed ahead of time, such as the static export
+BEST_LEVELS = {"br": 11, "gzip": 9}
+
+# files whose content changes what the app renders, hashed by build_version
+BUILD_FILE_TYPES = (".py", ".html")
+
+
+def compress(body, encoding, levels=ON_DEMAND_LEVELS):
+    """Compresses a response body with a content encoding.
+
+    Parameters
+    -----------
+    body: bytes of the response body
+    encoding: string of the content encoding, 'br' or 'gzip'
+    levels: dictionary of the compression level of each encoding
+
+    Returns
+    --------
+    bytes
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=levels["br"])
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=levels["gzip"])
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def choose_encoding(accept_encodings):
+    """Picks the preferred content encoding the client accepts.
+
+    Parameters
+    -----------
+    accept_encodings: werkzeug Accept object of the request's Accept-Encoding header
+
+    Returns
+    --------
+    string of the content encoding, None to send the body uncompressed
+    """
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def build_version(paths):
+    """Hashes the code and templates a deployment renders with.
+
+    Parameters
+    -----------
+    paths: list of files and directories, directories are searched for .py and .html files
+
+    Returns
+    --------
+    string of a short hash of the file names and contents
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, filename)
+                for root, dirs, filenames in os.walk(path)
+                for filename in filenames
+                if filename.endswith(BUILD_FILE_TYPES)
+            )
+        else:
+            files = [path]
+        for filepath in files:
+            digest.update(os.path.relpath(filepath, os.path.dirname(path)).encode("utf-8"))
+            with open(filepath, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def make_etag(version, key, encoding=None):
+    """Creates a strong ETag for a rendered output of a data snapshot.
+
+    Parameters
+    -----------
+    version: string identifying the dashboard data snapshot and the build rendering it
+    key: string identifying the rendered output, e.g. the route and date
+    encoding: content encoding of the body, None when uncompressed
+
+    Returns
+    --------
+    string
+    """
+    digest = hashlib.sha1(f"{version}:{key}".encode("utf-8")).hexdigest()[:16]
+    return f"{digest}-{encoding}" if encoding else digest
+
+
+class CompressedCache:
+    """Bounded least recently used cache of compressed response bodies.
+
+    Bodies are compressed at ON_DEMAND_LEVELS, since a miss compresses while the request waits.
+
+    Attributes
+    -----------
+    maxsize: maximum number of compressed bodies held in memory
+    hits: number of lookups answered from the cache
+    misses: number of lookups that had to compress the body
+    """
+
+    def __init__(self, maxsize=512):
+        """The constructor for CompressedCache class.
+
+        Parameters
+        -----------
+        maxsize: maximum number of compressed bodies held in memory
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, encoding, render):
+        """Returns the compressed body for a key, compressing and storing it if it isn't cached.
+
+        Parameters
+        -----------
+        key: string identifying the rendered output
+        encoding: string of the content encoding
+        render: function returning the uncompressed body as bytes
+
+        Returns
+        --------
+        bytes
+        """
+        with self._lock:
+            if (key, encoding) in self._bodies:
+                self._bodies.move_to_end((key, encoding))
+                self.hits += 1
+                return self._bodies[(key, encoding)]
+
+        body = compress(render(), encoding)
+        with self._lock:
+            self.misses += 1
+            if self.maxsize > 0:
+                self._bodies[(key, encoding)] = body
+                while len(self._bodies) > self.maxsize:
+                    self._bodies.popitem(last=False)
+        return body
+
+    def clear(self):
+        """Empties the cache and resets the counters."""
+        with self._lock:
+            self._bodies.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dictionary of cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._bodies),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "encodings": ENCODINGS,
+            }
@@ -0,0 +1,279 @@
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from src.calls_cache import file_hash
+from src.forecast_arrays import ForecastArrays, META_FILE
+from src.geometry_simplify import GEOMETRY_LEVELS, geometry_filename
+from src.spatial_index import SpatialIndex
+from src.color_palette import color_indexes
+
+
+GEOJSON_FILE = "seattle_neighborhood_shapes.geojson"
+
+# pickles written by the modeling notebook, used when the columnar files haven't been exported or are older
+PICKLE_FILES = [
+    "city_predictions.pkl",
+    "neighborhood_ratings.pkl",
+    "neighborhood_predictions.pkl",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def data_files(data_dir):
+    """Returns the files a snapshot is versioned by, the columnar sidecar when it has been exported.
+
+    The sidecar names the .npy files of its save and carries a hash of them, so it stands in
+    for the arrays. Pickles published after the export, newer than the sidecar and not the
+    files it was converted from, are used instead and logged as a warning, so forecasts that
+    were only written as pickles are served rather than the stale export.
+
+    Parameters
+    -----------
+    data_dir: directory with the dashboard data files
+
+    Returns
+    --------
+    list of file names
+    """
+    meta_path = os.path.join(data_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return PICKLE_FILES + [GEOJSON_FILE]
+    exported = os.stat(meta_path).st_mtime_ns
+    newer = [
+        filename for filename in PICKLE_FILES
+        if os.path.exists(os.path.join(data_dir, filename))
+        and os.stat(os.path.join(data_dir, filename)).st_mtime_ns > exported
+    ]
+    if newer:
+        # a checkout can leave unchanged pickles newer than the sidecar, so their contents decide
+        with open(meta_path) as f:
+            sources = json.load(f).get("sources", {})
+        published = [filename for filename in newer
+                     if sources.get(filename) != file_hash(os.path.join(data_dir, filename))]
+        if published:
+            logger.warning(
+                "%s in %s changed after %s was exported, serving the pickles until "
+                "`python -m src.forecast_arrays %s` exports them again",
+                ", ".join(published), data_dir, META_FILE, data_dir,
+            )
+            return PICKLE_FILES + [GEOJSON_FILE]
+    return [META_FILE, GEOJSON_FILE]
+
+
+class DashboardSnapshot:
+    """An immutable load of the dashboard data directory and everything derived from it.
+
+    Attributes
+    -----------
+    data_dir: directory the snapshot was loaded from
+    version: short hash of the data files, used to key cached renders and etags
+    forecast_arrays: ForecastArrays of the forecasts on a sorted date axis, memory mapped when exported
+    date_index: dictionary of dates to row positions in forecast_arrays
+    neighborhood_geojson: bytes of the neighborhood GeoJSON, parsed by neighborhood_shapes when needed
+    feature_names: list of neighborhood names in GeoJSON feature order
+    spatial_index: SpatialIndex of the neighborhood polygons for point lookups
+    feature_columns: array of the forecast column of each GeoJSON feature, -1 for features without forecasts
+    feature_ratings: array (dates x features) of ratings in GeoJSON feature order, 0.5 for features without forecasts
+    feature_colors: uint8 array (dates x features) of feature_ratings quantized to palette indexes
+    table_neighborhoods: list of neighborhood names in table order
+    table_averages: array of long-term neighborhood averages rounded for the table
+    geometry_levels: list of dictionaries of the simplified geometry files available
+    """
+
+    def __init__(self, data_dir="dashboard_data"):
+        """The constructor for DashboardSnapshot class.
+
+        Each file is read into memory once and parsed from those bytes, so the version always
+        matches the data even if the files are replaced while loading. Exported forecasts are
+        opened as read-only memory maps instead of being read.
+
+        Parameters
+        -----------
+        data_dir: directory with the dashboard data files
+        """
+        self.data_dir = data_dir
+        raw = {}
+        digest = hashlib.sha1()
+        for filename in data_files(data_dir):
+            with open(os.path.join(data_dir, filename), "rb") as f:
+                raw[filename] = f.read()
+            digest.update(raw[filename])
+        self.version = digest.hexdigest()[:12]
+
+        if META_FILE in raw:
+            self.forecast_arrays = ForecastArrays.load(data_dir)
+        else:
+            self.forecast_arrays = ForecastArrays.from_frames(
+                *[pd.read_pickle(BytesIO(raw[filename])) for filename in PICKLE_FILES]
+            )
+        # read-only so preloaded workers share the pages instead of copying them
+        for values in [self.forecast_arrays.predictions, self.forecast_arrays.ratings, self.forecast_arrays.city]:
+            values.flags.writeable = False
+        self.date_index = self.forecast_arrays.date_index
+
+        # the GeoJSON is kept as one bytes object instead of a tree of python objects whose
+        # reference counts would dirty shared pages in every forked worker
+        self.neighborhood_geojson = raw[GEOJSON_FILE]
+        self.spatial_index = SpatialIndex(self.neighborhood_geojson)
+        self.feature_names = self.spatial_index.names
+
+        # ratings aligned to the map's features and quantized once per load, so coloring a map is an array lookup
+        columns = {name: i for i, name in enumerate(self.forecast_arrays.neighborhoods)}
+        self.feature_columns = np.array([columns.get(name, -1) for name in self.feature_names], dtype=np.int64)
+        unmatched_features = [name for name in self.feature_names if name not in columns]
+        unmatched_columns = sorted(set(columns) - set(self.feature_names))
+        if unmatched_features or unmatched_columns:
+            logger.warning(
+                "Neighborhood names don't match between the GeoJSON and the forecasts, map features "
+                "without forecasts: %s; forecasts without map features: %s",
+                ", ".join(unmatched_features) or "none", ", ".join(unmatched_columns) or "none",
+            )
+        self.feature_ratings = self.by_feature(self.forecast_arrays.ratings)
+        self.feature_colors = color_indexes(self.feature_ratings)
+
+        # long-term averages computed once per load, daily rows are rounded when a table is rendered
+        self.table_neighborhoods = self.forecast_arrays.neighborhoods
+        self.table_averages = np.round(self.forecast_arrays.prediction_means, decimals=2)
+
+        # simplified topojson built by `python -m src.geometry_simplify`
+        self.geometry_levels = [
+            {"url": "/geometry/" + geometry_filename(name), "min_zoom": min_zoom}
+            for name, tolerance, quantization, min_zoom in GEOMETRY_LEVELS
+            if os.path.exists(os.path.join(data_dir, "geometry", geometry_filename(name)))
+        ]
+
+    def neighborhood_shapes(self):
+        """Returns a newly parsed dictionary of the neighborhood GeoJSON."""
+        return json.loads(self.neighborhood_geojson)
+
+    def by_feature(self, values, fill=0.5):
+        """Reorders forecast columns to GeoJSON feature order.
+
+        Parameters
+        -----------
+        values: array (... x neighborhoods) in forecast column order
+        fill: value for features without forecasts
+
+        Returns
+        --------
+        array (... x features)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        aligned = values[..., np.maximum(self.feature_columns, 0)]
+        aligned[..., self.feature_columns < 0] = fill
+        return aligned
+
+
+def data_signature(data_dir):
+    """Returns the size and modification time of every data file, used to notice new data.
+
+    Parameters
+    -----------
+    data_dir: directory with the dashboard data files
+
+    Returns
+    --------
+    tuple
+    """
+    signature = []
+    for filename in [META_FILE] + PICKLE_FILES + [GEOJSON_FILE]:
+        try:
+            stat = os.stat(os.path.join(data_dir, filename))
+            signature.append((filename, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append((filename, None, None))
+    return tuple(signature)
+
+
+class SnapshotManager:
+    """Holds the current dashboard snapshot and swaps in new ones without blocking requests.
+
+    Requests read `current` once and keep using that snapshot, so a swap never mixes data
+    from two loads within one request.
+
+    Attributes
+    -----------
+    data_dir: directory with the dashboard data files
+    current: DashboardSnapshot being served
+    on_swap: list of functions called with the old and new snapshot after a swap
+    """
+
+    def __init__(self, data_dir="dashboard_data"):
+        """The constructor for SnapshotManager class.
+
+        Parameters
+        -----------
+        data_dir: directory with the dashboard data files
+        """
+        self.data_dir = data_dir
+        self._signature = data_signature(data_dir)
+        self.current = DashboardSnapshot(data_dir)
+        self.on_swap = []
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+
+    def reload(self):
+        """Loads the data directory and swaps the new snapshot in if the data changed.
+
+        Returns
+        --------
+        boolean, True if a new snapshot was swapped in
+        """
+        with self._reload_lock:
+            signature = data_signature(self.data_dir)
+            try:
+                snapshot = DashboardSnapshot(self.data_dir)
+            except Exception:
+                logger.exception("Failed to load dashboard data, keeping snapshot %s", self.current.version)
+                return False
+            self._signature = signature
+            if snapshot.version == self.current.version:
+                return False
+            old, self.current = self.current, snapshot
+            logger.info("Swapped dashboard snapshot %s for %s", old.version, snapshot.version)
+            for callback in self.on_swap:
+                callback(old, snapshot)
+            return True
+
+    def reload_in_background(self):
+        """Starts a reload on a daemon thread and returns the thread."""
+        thread = threading.Thread(target=self.reload, name="snapshot-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def watch(self, interval=30):
+        """Polls the data directory and reloads when the files have changed and stopped changing.
+
+        Parameters
+        -----------
+        interval: seconds between polls
+        """
+        # threads don't survive a fork, so a forked worker starts its own
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        def poll():
+            pending = None
+            while True:
+                time.sleep(interval)
+                signature = data_signature(self.data_dir)
+                if signature == self._signature:
+                    pending = None
+                elif signature == pending:
+                    # unchanged since the last poll, the writer is done
+                    self.reload()
+                    pending = None
+                else:
+                    pending = signature
+
+        self._watcher = threading.Thread(target=poll, name="snapshot-watch", daemon=True)
+        self._watcher.start()
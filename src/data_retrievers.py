@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 import datetime as dt
 
+from src.call_counts import CALL_COLUMNS, CallCounts, CountStore
+from src.calls_cache import cache_is_current, read_calls_cache, write_calls_cache
+
 
 class DataRetrieval:
 
@@ -21,6 +24,114 @@ class DataRetrieval:
         df.reset_index(drop=True, inplace=True)
         return df
 
+    def get_cached_calls_data(
+        self,
+        filepath="../data/Calls_Table_data.csv",
+        cache_dir="../data/calls_cache",
+        columns=CALL_COLUMNS,
+        chunksize=100000,
+    ):
+        """Retrieves call for service data from a typed columnar cache of the csv file
+
+        The csv file is converted once, streaming it through iter_calls_data, into a cache of
+        int64 times and dictionary-encoded columns. Later calls read only the columns asked for
+        until the file's size, mtime or contents change.
+
+        Parameters
+        -----------
+        filepath : location of the file
+        cache_dir : directory of the cache
+        columns : list of columns retrieved
+        chunksize : number of rows read at a time when converting the file
+        Returns
+        --------
+        datafrarme with datetime64 ORIG_TIME_QUEUED and categorical columns
+        """
+
+        if not cache_is_current(cache_dir, filepath, columns):
+            write_calls_cache(
+                cache_dir, filepath, self.iter_calls_data(filepath, chunksize, columns), columns
+            )
+        return read_calls_cache(cache_dir, columns)
+
+    def iter_calls_data(
+        self,
+        filepath="../data/Calls_Table_data.csv",
+        chunksize=100000,
+        columns=CALL_COLUMNS,
+    ):
+        """Reads call for service data from csv file in chunks, dropping duplicate calls
+
+        Duplicates are found by a 64-bit hash of every column of a row, so only the hashes of
+        the calls seen so far are held between chunks. Each chunk keeps only the columns asked for.
+
+        Parameters
+        -----------
+        filepath : location of the file
+        chunksize : number of rows read at a time
+        columns : list of columns kept
+        Returns
+        --------
+        generator of dataframes
+        """
+
+        seen = np.empty(0, dtype=np.uint64)
+        reader = pd.read_csv(
+            filepath, delimiter="\t", encoding="utf-16", dtype=str, chunksize=chunksize
+        )
+        for chunk in reader:
+            hashes = pd.util.hash_pandas_object(chunk, index=False).values
+            # seen is kept sorted, so lookups and inserts are binary searches
+            positions = np.minimum(np.searchsorted(seen, hashes), max(len(seen) - 1, 0))
+            in_seen = seen[positions] == hashes if len(seen) else np.zeros(len(hashes), dtype=bool)
+            new = ~pd.Series(hashes).duplicated().values & ~in_seen
+            added = np.sort(hashes[new])
+            seen = np.insert(seen, np.searchsorted(seen, added), added)
+            yield chunk.loc[new, columns].reset_index(drop=True)
+
+    def count_calls_data(self, filepath="../data/Calls_Table_data.csv", chunksize=100000):
+        """Counts call for service data by day and neighborhood while streaming the csv file
+
+        Parameters
+        -----------
+        filepath : location of the file
+        chunksize : number of rows read at a time
+        Returns
+        --------
+        CallCounts
+        """
+
+        return CallCounts.from_chunks(self.iter_calls_data(filepath, chunksize))
+
+    def update_call_counts(
+        self,
+        filepath="../data/Calls_Table_data.csv",
+        store_dir="../data/call_counts",
+        chunksize=100000,
+        window_start=None,
+    ):
+        """Folds a Calls for Service export into the persisted call counts and saves them
+
+        Calls queued after the counts' high-water mark are added. An export reaching back to
+        the high-water mark must hold every call from window_start, a midnight, and the days
+        from window_start to the high-water mark are recounted from it. See CountStore.update
+
+        Parameters
+        -----------
+        filepath : location of the file
+        store_dir : directory of the persisted counts
+        chunksize : number of rows read at a time
+        window_start : midnight the export's window starts at, needed when it reaches back to the high-water mark
+        Returns
+        --------
+        CountStore
+        """
+
+        store = CountStore.load(store_dir)
+        store.update(self.iter_calls_data(filepath, chunksize), window_start)
+        store.save()
+        return store
+
     def get_weather_data(self, filepath="../data/historical_weather.csv"):
         """Retrieves historical weather ata from csv file and converts to dataframe
 
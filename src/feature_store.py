@@ -0,0 +1,138 @@
+import os
+import json
+import inspect
+import hashlib
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+
+from src.calls_cache import file_hash, write_json
+
+
+MANIFEST_FILE = "feature_store.json"
+
+# stores opened in this process, by directory
+_stores = {}
+
+
+def package_version(name):
+    """Returns the installed version of a package, an empty string if it isn't installed."""
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return ""
+
+
+def source_hash(files=(), rules=()):
+    """Hashes everything a feature is built from.
+
+    Parameters
+    -----------
+    files: list of paths of source files, hashed by content
+    rules: list of the rules applied to them: classes and functions are hashed by their
+        source code, strings as they are and anything else as sorted json
+
+    Returns
+    --------
+    string of the sha1 hex digest
+    """
+    digest = hashlib.sha1()
+    for filepath in files:
+        digest.update(file_hash(filepath).encode("ascii"))
+    for rule in rules:
+        if inspect.isclass(rule) or inspect.isfunction(rule) or inspect.ismethod(rule):
+            rule = inspect.getsource(rule)
+        elif not isinstance(rule, str):
+            rule = json.dumps(rule, sort_keys=True, default=str)
+        digest.update(rule.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def slice_dates(frame, start, end):
+    """Returns the rows of a frame with a date column from start to end, both inclusive.
+
+    Parameters
+    -----------
+    frame: dataframe with a date column
+    start: datetime64, datetime.date or string of the first date
+    end: datetime64, datetime.date or string of the last date
+
+    Returns
+    --------
+    dataframe
+    """
+    days = pd.to_datetime(frame["date"]).values.astype("datetime64[D]")
+    return frame[(days >= np.datetime64(start, "D")) & (days <= np.datetime64(end, "D"))]
+
+
+class FeatureStore:
+    """Date-indexed feature frames built once and persisted on disk.
+
+    Each frame is saved as a pickle with the hash of its source files and rules in a json
+    manifest, and is only rebuilt when that hash changes. Frames are also kept in memory,
+    so later requests in the same process only hash the sources.
+
+    Attributes
+    -----------
+    directory: directory the frames are saved in
+    """
+
+    def __init__(self, directory):
+        """The constructor for FeatureStore class.
+
+        Parameters
+        -----------
+        directory: directory the frames are saved in
+        """
+        self.directory = directory
+        self._frames = {}
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self._manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self._manifest = json.load(f)
+
+    @classmethod
+    def open(cls, directory):
+        """Returns the store of a directory, shared by every caller in this process."""
+        if directory not in _stores:
+            _stores[directory] = cls(directory)
+        return _stores[directory]
+
+    def get(self, name, build, files=(), rules=()):
+        """Returns a feature frame, building and saving it when its sources have changed.
+
+        Parameters
+        -----------
+        name: name of the feature
+        build: function returning the feature's dataframe
+        files: list of paths of the files the feature is built from
+        rules: list of the rules the feature is built with, see source_hash
+
+        Returns
+        --------
+        dataframe
+        """
+        digest = source_hash(files, rules)
+        cached = self._frames.get(name)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        entry = self._manifest.get(name)
+        if entry is not None and entry["sha1"] == digest:
+            frame = pd.read_pickle(os.path.join(self.directory, entry["file"]))
+        else:
+            frame = build()
+            self._save(name, digest, frame)
+        self._frames[name] = (digest, frame)
+        return frame
+
+    def _save(self, name, digest, frame):
+        """Writes a frame under a temporary name moved into place, then records it in the manifest."""
+        os.makedirs(self.directory, exist_ok=True)
+        filename = name + ".pkl"
+        tmp_path = os.path.join(self.directory, filename + ".tmp")
+        frame.to_pickle(tmp_path)
+        os.replace(tmp_path, os.path.join(self.directory, filename))
+        self._manifest[name] = {"sha1": digest, "file": filename, "rows": len(frame)}
+        write_json(os.path.join(self.directory, MANIFEST_FILE), self._manifest)
@@ -1,8 +1,14 @@
+import inspect
+
 import pandas as pd
 import numpy as np
 import datetime as dt
 
 from src.holiday_calendars import SeattleHolidays
+from src.call_counts import CallCounts
+from src.calendar_features import MONTH_WEEKDAYS, calendar_features, day_offsets
+from src.sparse_design import SparseDesign
+from src.feature_store import FeatureStore, package_version, slice_dates
 from src.data_retrievers import DataRetrieval
 from src.weather_scraper import seattle_weather_fcst
 
@@ -13,17 +19,20 @@ class CountCalls:
     Attributes
     -----------
     how: grouping level to count calls by. Either city or neighborhood
+    dense: return neighborhood counts as a CallCounts of a dense days x neighborhoods array instead of a dataframe
     """
 
-    def __init__(self, how="city"):
+    def __init__(self, how="city", dense=False):
         """The constructor for CounterCalls class.
 
         Parameters
         -----------
         how: grouping level to count calls by. Either city or neighborhood
+        dense: return neighborhood counts as a CallCounts of a dense days x neighborhoods array instead of a dataframe
         """
 
         self.how = how
+        self.dense = dense
         self.X = None
         self.y = None
 
@@ -32,7 +41,7 @@ class CountCalls:
 
         Parameters
         -----------
-        X: dataframe
+        X: dataframe, or CallCounts of calls already counted by DataRetrieval.count_calls_data
 
         Returns
         --------
@@ -46,15 +55,30 @@ class CountCalls:
     def transform(self, y=None):
         """Transforms the calls for service dataframe into a dataframe of call counter per day.
 
+        Neighborhood counts have a row for every neighborhood on every day from the first to
+        the last call, with zeros for days without calls.
+
         Parameters
         -----------
         X: dataframe
 
         Returns
         --------
-        dataframe
+        dataframe, or CallCounts when counting dense neighborhood counts
         """
 
+        if isinstance(self.X, CallCounts):
+            counts = self.X
+            if self.how == "city":
+                # city totals include calls without a neighborhood, as when counting a dataframe
+                return pd.DataFrame(
+                    {
+                        "date": pd.DatetimeIndex(counts.dates).date,
+                        "num_calls": counts.city.astype(np.int64),
+                    }
+                ).query("num_calls > 0").reset_index(drop=True)
+            return counts if self.dense else counts.to_frame()
+
         if self.how == "city":
             df = self.X[["ORIG_TIME_QUEUED", "EVENT"]].copy()
             df["date"] = pd.to_datetime(df["ORIG_TIME_QUEUED"]).dt.date
@@ -67,42 +91,10 @@ class CountCalls:
             )
 
         else:
-            df = self.X[["NEIGHBORHOOD", "ORIG_TIME_QUEUED", "EVENT"]].copy()
-            df["date"] = pd.to_datetime(df["ORIG_TIME_QUEUED"]).dt.date
-            df.drop("ORIG_TIME_QUEUED", axis=1, inplace=True)
-            counts = (
-                df.groupby(["NEIGHBORHOOD", "date"])
-                .count()
-                .rename(columns={"NEIGHBORHOOD": "neighborhood", "EVENT": "num_calls"})
-                .reset_index()
-            )
-
-            neighborhoods = list(counts["NEIGHBORHOOD"].unique())
-            num_days = (
-                int(
-                    np.timedelta64((max(counts["date"]) - min(counts["date"])), "D")
-                    / np.timedelta64(1, "D")
-                )
-                + 1
-            )
-            start = pd.to_datetime(min(counts["date"]))
-            neighboor_arr = np.array([(neighborhoods * num_days)])
-            neighboor_arr = neighboor_arr.flatten()
-            dates = [(start + np.timedelta64(i, "D")) for i in range(num_days)] * len(
-                neighborhoods
-            )
-
-            df2 = pd.DataFrame({"dt_time": dates})
-            df2["date"] = df2["dt_time"].dt.date
-            df2["neighborhood"] = neighboor_arr
-            df3 = pd.merge(
-                df2,
-                counts,
-                how="outer",
-                left_on=["date", "neighborhood"],
-                right_on=["date", "NEIGHBORHOOD"],
-            ).fillna(0)
-            return df3[["date", "neighborhood", "num_calls"]]
+            counts = CallCounts.from_calls(self.X)
+            if self.dense:
+                return counts
+            return counts.to_frame()
 
 
 class FeaturizeCalls:
@@ -152,29 +144,17 @@ class FeaturizeCalls:
         dataframe
         """
 
-        df = self.X.copy()
-        num_days = (
-            int(
-                np.timedelta64((max(df["date"]) - min(df["date"])), "D")
-                / np.timedelta64(1, "D")
-            )
-            + 1
-        )
-        start = pd.to_datetime(min(df["date"]))
-        dates = [(start + np.timedelta64(i, "D")) for i in range(num_days)]
-
-        seq = pd.DataFrame({"dt_time": dates, "day_seq": np.arange(num_days)})
-        seq["date"] = seq["dt_time"].dt.date
-
-        df1 = df.join(seq.set_index("date"), on="date")
-
-        df1["year"] = df1["dt_time"].dt.year
-        df1["month"] = df1["dt_time"].dt.month
-        df1["day"] = df1["dt_time"].dt.day
-        df1["day_of_week"] = df1["dt_time"].dt.weekday
-        df1["month_day"] = df1["dt_time"].dt.strftime("%m/%d")
-        df1["month_weekday"] = df1["dt_time"].dt.strftime("%b_%a")
-        df1["month"] = df1["dt_time"].dt.strftime("%m/%d")
+        df1 = self.X.copy()
+        # each distinct date is looked up in the calendar table once
+        codes, dates = pd.factorize(df1["date"])
+        offsets = day_offsets(dates)[codes]
+        features = calendar_features(offsets)
+
+        df1["dt_time"] = features["dt_time"].values
+        df1["day_seq"] = offsets - offsets.min()
+        for column in ["year", "month", "day", "day_of_week", "month_day", "month_weekday"]:
+            df1[column] = features[column].values
+        df1["month"] = df1["month_day"]
         return df1
 
 
@@ -183,16 +163,17 @@ class DateDummies:
     
     Attributes
     -----------
-    None
+    sparse: return a SparseDesign of one row per date instead of a dataframe
     """
-    def __init__(self):
+    def __init__(self, sparse=False):
         """The constructor for DateDummies class.
 
         Parameters
         -----------
-        None
+        sparse: return a SparseDesign of one row per date instead of a dataframe
         """
 
+        self.sparse = sparse
         self.X = None
         self.y = None
 
@@ -221,7 +202,7 @@ class DateDummies:
 
         Returns
         --------
-        dataframe
+        dataframe, or SparseDesign of day_seq and the dummy variables when sparse
         """
 
         day_features = [
@@ -275,6 +256,16 @@ class DateDummies:
             "12/23",
             "12/29",
         ]
+        if self.sparse:
+            days = self.X.drop_duplicates("date")
+            return SparseDesign.from_frame(days[["date", "day_seq"]]).join(
+                SparseDesign.from_dummies(days["date"], days["day"], "day", list(range(1, 32))),
+                SparseDesign.from_dummies(
+                    days["date"], days["month_weekday"], "month_weekday", sorted(MONTH_WEEKDAYS)
+                ),
+                SparseDesign.from_dummies(days["date"], days["month_day"], "spec_day", day_features),
+            )
+
         spec_days = pd.DataFrame({"month_day": day_features, "spec_day": day_features})
         df = self.X.join(spec_days.set_index("month_day"), on="month_day")
 
@@ -294,15 +285,16 @@ class HolidayDummies:
     
     Attributes
     -----------
-    None
+    sparse: return a SparseDesign of one row per date instead of a dataframe
     """
-    def __init__(self):
+    def __init__(self, sparse=False):
         """The constructor for HolidayDummies class.
 
         Parameters
         -----------
-        None
+        sparse: return a SparseDesign of one row per date instead of a dataframe
         """
+        self.sparse = sparse
         self.X = None
         self.y = None
 
@@ -331,11 +323,14 @@ class HolidayDummies:
 
         Returns
         --------
-        dataframe
+        dataframe, or SparseDesign when sparse
         """
         _holidays = []
         for date in sorted(self.X.keys()):
             _holidays.append([date, self.X[date]])
+        if self.sparse:
+            dates, names = zip(*_holidays) if _holidays else ((), ())
+            return SparseDesign.from_dummies(dates, names, "holiday")
         _holidays = pd.DataFrame(_holidays, columns=["date", "holiday"])
         return pd.get_dummies(_holidays.set_index("date")).reset_index()
 
@@ -346,18 +341,21 @@ class EventDummies:
     Attributes
     -----------
     event_dict: Dictionary of local events in Seattle {keys= str of event names, values=string of dates for event}
+    sparse: return a SparseDesign of one row per date instead of a dataframe
     """
 
-    def __init__(self, event_dict=None):
+    def __init__(self, event_dict=None, sparse=False):
         """The constructor for EventDummies class.
 
         Parameters
         -----------
         event_dict: Dictionary of local events in Seattle {keys= str of event names, values=string of dates for event}
+        sparse: return a SparseDesign of one row per date instead of a dataframe
         """
         self.X = None
         self.y = None
         self.event_dict = event_dict
+        self.sparse = sparse
 
         defualt_events = {
             "Pride Parade": [
@@ -446,7 +444,7 @@ class EventDummies:
 
         Returns
         --------
-        dataframe
+        dataframe, or SparseDesign when sparse
         """
         _events = []
         for event in self.event_dict.keys():
@@ -455,6 +453,9 @@ class EventDummies:
 
         _events = pd.DataFrame(_events, columns=["date", "local_event"])
         _events["date"] = _events["date"].dt.date
+        if self.sparse:
+            # a date with several events is one row with each of their dummies set
+            return SparseDesign.from_dummies(_events["date"], _events["local_event"], "local_event")
         return pd.get_dummies(_events.set_index("date")).reset_index()
 
 
@@ -463,15 +464,16 @@ class MakeDummies:
     
     Attributes
     -----------
-    None
+    sparse: return a SparseDesign of one row per date instead of a dataframe
     """
-    def __init__(self):
+    def __init__(self, sparse=False):
         """The constructor for MakeDummies class.
 
         Parameters
         -----------
-        None
+        sparse: return a SparseDesign of one row per date instead of a dataframe
         """
+        self.sparse = sparse
         self.X = None
         self.y = None
 
@@ -499,8 +501,15 @@ class MakeDummies:
 
         Returns
         --------
-        dataframe
+        dataframe, or SparseDesign when sparse
         """
+        if self.sparse:
+            # numeric columns are kept and text columns become dummies, in the order of pd.get_dummies
+            text = [column for column in self.X.columns if column != "date" and self.X[column].dtype == object]
+            numeric = [column for column in self.X.columns if column != "date" and column not in text]
+            return SparseDesign.from_frame(self.X[["date"] + numeric]).join(
+                *[SparseDesign.from_dummies(self.X["date"], self.X[column], column) for column in text]
+            )
         return pd.get_dummies(self.X.set_index("date")).reset_index()
 
 
@@ -509,15 +518,19 @@ class MakeModelInput:
     
     Attributes
     -----------
-    None
+    sparse: join the features onto the SparseDesign from DateDummies instead of a dataframe
+    store_dir: directory of the feature store the weather, holiday, event and sports features are kept in
     """
-    def __init__(self):
+    def __init__(self, sparse=False, store_dir="../data/feature_store"):
         """The constructor for MakeModelInput class.
 
         Parameters
         -----------
-        None
+        sparse: join the features onto the SparseDesign from DateDummies instead of a dataframe
+        store_dir: directory of the feature store the weather, holiday, event and sports features are kept in
         """
+        self.sparse = sparse
+        self.store_dir = store_dir
         self.X = None
         self.y = None
 
@@ -546,48 +559,88 @@ class MakeModelInput:
 
         Returns
         --------
-        dataframe
+        dataframe, or SparseDesign when sparse
+        """
+        if isinstance(self.X, SparseDesign):
+            days = self.X.dates
+        else:
+            days = pd.to_datetime(pd.unique(self.X["date"])).values.astype("datetime64[D]")
+        features = [
+            slice_dates(feature, days.min(), days.max()) for feature in self.exogenous_features()
+        ]
+        joiner = JoinDataFrames(*features, sparse=self.sparse)
+        joiner.fit(self.X)
+        return joiner.transform()
+
+    def exogenous_features(self):
+        """Returns the weather, holiday, event and sports features from the feature store.
+
+        Each feature is built once and saved in the store, and is rebuilt when the content of
+        its source files or the code of its rules (holiday calendars, events, retrievers and
+        dummy transformers) changes.
+
+        Returns
+        --------
+        list of dataframes in the order JoinDataFrames takes them
         """
+        store = FeatureStore.open(self.store_dir)
         retriever = DataRetrieval()
-        weather = retriever.get_weather_data()
-        seahawks_schedule = retriever.get_seahawks_schedule()
-        huskies_schedule = retriever.get_huskies_schedule()
-        sounders_schedule = retriever.get_sounders_schedule()
         sports = MakeDummies()
-        sports.fit(seahawks_schedule)
-        seahawks = sports.transform()
-        sports.fit(huskies_schedule)
-        huskies = sports.transform()
-        sports.fit(sounders_schedule)
-        sounders = sports.transform()
-        us_holiday_dict = SeattleHolidays.CustomHolidays()
-        us_holiday_dict._populate()
         holidayier = HolidayDummies()
-        holidayier.fit(us_holiday_dict)
-        us_holidays = holidayier.transform()
-        jewish_holiday_dict = SeattleHolidays.JewishHolidays()
-        jewish_holiday_dict._populate()
-        holidayier.fit(jewish_holiday_dict)
-        jewish_holidays = holidayier.transform()
-        islamic_holiday_dict = SeattleHolidays.IslamicHolidays()
-        islamic_holiday_dict._populate()
-        holidayier.fit(islamic_holiday_dict)
-        islamic_holidays = holidayier.transform()
+        holidays_version = package_version("holidays")
+        calendra_version = package_version("calendra")
+        hebcal_paths = default_argument(SeattleHolidays.JewishHolidays._populate, "paths_list")
         event_dummies = EventDummies()
-        event_dummies.fit()
-        events = event_dummies.transform()
-        joiner = JoinDataFrames(
-            weather,
-            us_holidays,
-            islamic_holidays,
-            jewish_holidays,
-            events,
-            seahawks,
-            huskies,
-            sounders,
-        )
-        joiner.fit(self.X)
-        return joiner.transform()
+
+        def holiday_dummies(calendar, **kwargs):
+            calendar._populate(**kwargs)
+            return holidayier.fit(calendar).transform()
+
+        def schedule(name, get_schedule):
+            return store.get(
+                name,
+                lambda: sports.fit(get_schedule()).transform(),
+                files=[default_argument(get_schedule, "filepath")],
+                rules=[get_schedule, MakeDummies],
+            )
+
+        return [
+            store.get(
+                "weather",
+                retriever.get_weather_data,
+                files=[default_argument(retriever.get_weather_data, "filepath")],
+                rules=[retriever.get_weather_data],
+            ),
+            store.get(
+                "us_holidays",
+                lambda: holiday_dummies(SeattleHolidays.CustomHolidays()),
+                rules=[SeattleHolidays.CustomHolidays, HolidayDummies, holidays_version, calendra_version],
+            ),
+            store.get(
+                "islamic_holidays",
+                lambda: holiday_dummies(SeattleHolidays.IslamicHolidays()),
+                rules=[SeattleHolidays.IslamicHolidays, HolidayDummies, holidays_version, calendra_version],
+            ),
+            store.get(
+                "jewish_holidays",
+                lambda: holiday_dummies(SeattleHolidays.JewishHolidays()),
+                files=hebcal_paths,
+                rules=[SeattleHolidays.JewishHolidays, HolidayDummies, holidays_version],
+            ),
+            store.get(
+                "events",
+                lambda: event_dummies.fit().transform(),
+                rules=[event_dummies.event_dict, EventDummies.transform],
+            ),
+            schedule("seahawks", retriever.get_seahawks_schedule),
+            schedule("huskies", retriever.get_huskies_schedule),
+            schedule("sounders", retriever.get_sounders_schedule),
+        ]
+
+
+def default_argument(function, name):
+    """Returns the default value of a function's argument."""
+    return inspect.signature(function).parameters[name].default
 
 
 class JoinDataFrames:
@@ -603,6 +656,7 @@ class JoinDataFrames:
     seahawks: Dataframe of dummy variables for Seahawks football games
     huskies: Dataframe of dummy variables for University of Washington Huskies football games
     sounders: Dataframe of dummy variables for Sounders FC soccer matches
+    sparse: join SparseDesigns onto a SparseDesign instead of dataframes onto a dataframe
     """
     def __init__(
         self,
@@ -614,6 +668,7 @@ class JoinDataFrames:
         seahawks,
         huskies,
         sounders,
+        sparse=False,
     ):
         """The constructor for JoinDataFrames class.
 
@@ -627,6 +682,7 @@ class JoinDataFrames:
         seahawks: Dataframe of dummy variables for Seahawks football games
         huskies: Dataframe of dummy variables for University of Washington Huskies football games
         sounders: Dataframe of dummy variables for Sounders FC soccer matches
+        sparse: join SparseDesigns onto a SparseDesign instead of dataframes onto a dataframe
         """
         self.weather = weather
         self.us_holidays = us_holidays
@@ -636,6 +692,7 @@ class JoinDataFrames:
         self.seahawks = seahawks
         self.huskies = huskies
         self.sounders = sounders
+        self.sparse = sparse
         self.X = None
         self.y = None
 
@@ -663,8 +720,27 @@ class JoinDataFrames:
 
         Returns
         --------
-        dataframe
+        dataframe, or SparseDesign when sparse
         """
+        if self.sparse:
+            # dataframes such as the weather are converted, dates without a row are zeros
+            features = [
+                self.weather,
+                self.us_holidays,
+                self.islamic_holidays,
+                self.jewish_holidays,
+                self.events,
+                self.seahawks,
+                self.huskies,
+                self.sounders,
+            ]
+            return self.X.join(
+                *[
+                    feature if isinstance(feature, SparseDesign) else SparseDesign.from_frame(feature)
+                    for feature in features
+                ]
+            )
+
         df1 = self.join_dfs(self.X, self.weather)
         df2 = self.join_dfs(df1, self.us_holidays)
         df3 = self.join_dfs(df2, self.islamic_holidays)
@@ -741,19 +817,8 @@ class FeaturizeDates:
         --------
         dataframe
         """
-        num_days = (
-            int(
-                np.timedelta64(
-                    pd.to_datetime(self.end_date) - pd.to_datetime(self.start_date), "D"
-                )
-                / np.timedelta64(1, "D")
-            )
-            + 1
-        )
-        dates = [
-            (pd.to_datetime(self.start_date) + np.timedelta64(i, "D"))
-            for i in range(num_days)
-        ]
+        start, end = day_offsets([self.start_date, self.end_date])
+        num_days = end - start + 1
         start_seq = int(
             (
                 np.timedelta64(
@@ -764,16 +829,8 @@ class FeaturizeDates:
             )
             / np.timedelta64(1, "D")
         )
-        df = pd.DataFrame(
-            {"dt_time": dates, "day_seq": np.arange(start_seq, start_seq + num_days)}
-        )
-        df["date"] = df["dt_time"].dt.date
-        df["year"] = df["dt_time"].dt.year
-        df["month"] = df["dt_time"].dt.month
-        df["day"] = df["dt_time"].dt.day
-        df["day_of_week"] = df["dt_time"].dt.weekday
-        df["month_day"] = df["dt_time"].dt.strftime("%m/%d")
-        df["month_weekday"] = df["dt_time"].dt.strftime("%b_%a")
+        df = calendar_features(np.arange(start, end + 1))
+        df.insert(1, "day_seq", np.arange(start_seq, start_seq + num_days))
         return df
 
 
@@ -819,9 +876,12 @@ class AddWeatherForecast:
 
         Returns
         --------
-        dataframe
+        dataframe, or SparseDesign with the weather columns replaced when X is a SparseDesign
         """
-        forecast_dates = self.X[["dt_time", "month_day"]]
+        if isinstance(self.X, SparseDesign):
+            forecast_dates = calendar_features(day_offsets(self.X.dates))[["dt_time", "month_day"]]
+        else:
+            forecast_dates = self.X[["dt_time", "month_day"]]
         weather_avg = pd.read_csv("../data/weather_averages.csv")
         weather_fcst = weather_avg[
             ["DATE", "DLY-TMAX-NORMAL", "DLY-PRCP-50PCTL", "DLY-SNOW-50PCTL"]
@@ -854,6 +914,8 @@ class AddWeatherForecast:
                     weather_fcst["dt_time"] == near_term_weather["date"][0]
                 ] = 0
 
+        if isinstance(self.X, SparseDesign):
+            return self.X.assign(weather_fcst[["precip", "temp_max", "snow"]])
         self.X[["precip", "temp_max", "snow"]] = weather_fcst[
             ["precip", "temp_max", "snow"]
         ]
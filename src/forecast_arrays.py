@@ -0,0 +1,406 @@
+import os
+import re
+import sys
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from src.calls_cache import file_hash
+
+
+# arrays of the columnar dashboard data format, written by ForecastArrays.save as <name>-<version>.npy
+ARRAYS = ["predictions", "ratings", "city"]
+META_FILE = "forecast_meta.json"
+
+# array files of any save, including those of saves before files carried their version
+ARRAY_FILE_PATTERN = re.compile(r"^(predictions|ratings|city)(-[0-9a-f]{12})?\.npy$")
+
+
+def array_hash(arrays):
+    """Returns the version of forecast arrays, a short hash of their bytes.
+
+    Parameters
+    -----------
+    arrays: dictionary of the predictions, ratings and city arrays
+
+    Returns
+    --------
+    string
+    """
+    digest = hashlib.sha1()
+    for name in ARRAYS:
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()[:12]
+
+
+class ForecastArrays:
+    """Dashboard forecasts as numpy arrays on a shared, sorted daily date axis.
+
+    Attributes
+    -----------
+    dates: array of datetime64[D] forecast dates, sorted and unique
+    neighborhoods: list of neighborhood names, the columns of the matrices
+    predictions: array (dates x neighborhoods) of predicted calls
+    ratings: array (dates x neighborhoods) of heatmap ratings, NaN where a date has no rating
+    city: array of predicted calls for the whole city on each date
+    date_index: dictionary of datetime.date to row position
+    version: string identifying the data, set when loaded from the columnar format
+    rating_rows: array of the date position of each row of the notebook's ratings dataframe, -1 for
+        rows without a forecast date. /map/<index> links address these rows
+    cumulative_predictions: array (dates + 1 x neighborhoods) of prefix sums of predictions
+    cumulative_city: array (dates + 1) of prefix sums of city predictions
+    prediction_means: array of the mean daily prediction of each neighborhood
+    prediction_stds: array of the standard deviation of daily predictions of each neighborhood
+    """
+
+    def __init__(self, dates, neighborhoods, predictions, ratings, city, version=None, rating_rows=None):
+        """The constructor for ForecastArrays class.
+
+        Parameters
+        -----------
+        dates: array of datetime64[D] forecast dates, sorted and unique
+        neighborhoods: list of neighborhood names
+        predictions: array (dates x neighborhoods) of predicted calls
+        ratings: array (dates x neighborhoods) of heatmap ratings
+        city: array of predicted calls for the whole city on each date
+        version: string identifying the data
+        rating_rows: array of the date position of each row of the ratings dataframe, defaults to
+            one row per date
+        """
+        self.dates = dates
+        self.neighborhoods = list(neighborhoods)
+        self.predictions = predictions
+        self.ratings = ratings
+        self.city = city
+        self.version = version
+        self.rating_rows = (
+            np.arange(len(dates)) if rating_rows is None else np.asarray(rating_rows, dtype=np.int64)
+        )
+        # date lookups built once so routes don't scan the date axis per request
+        self.date_index = {date: i for i, date in enumerate(dates.tolist())}
+
+        # prefix sums over the date axis, the total of any date range is the difference of two rows
+        self.cumulative_predictions = np.zeros((len(dates) + 1, len(self.neighborhoods)))
+        np.cumsum(predictions, axis=0, dtype=np.float64, out=self.cumulative_predictions[1:])
+        self.cumulative_city = np.zeros(len(dates) + 1)
+        np.cumsum(city, dtype=np.float64, out=self.cumulative_city[1:])
+        self.prediction_means = np.asarray(predictions.mean(axis=0, dtype=np.float64))
+        self.prediction_stds = np.asarray(predictions.std(axis=0, ddof=1, dtype=np.float64))
+
+    @classmethod
+    def from_frames(cls, city_predictions, neighborhood_ratings, neighborhood_predictions):
+        """Creates forecast arrays from the dataframes written by the modeling notebook.
+
+        Parameters
+        -----------
+        city_predictions: array of city predictions, one per row of neighborhood_predictions
+        neighborhood_ratings: dataframe of ratings by neighborhood with a date column
+        neighborhood_predictions: dataframe of predictions by neighborhood with a date column
+
+        Returns
+        --------
+        ForecastArrays
+        """
+        dates = pd.to_datetime(neighborhood_predictions["date"]).values.astype("datetime64[D]")
+        # first row of each date, in date order
+        dates, rows = np.unique(dates, return_index=True)
+        predictions = neighborhood_predictions.drop(columns="date")
+        neighborhoods = list(predictions.columns)
+        predictions = predictions.values[rows].astype(np.float64)
+        city = np.asarray(city_predictions, dtype=np.float64)[rows]
+
+        rating_dates = pd.to_datetime(neighborhood_ratings["date"], errors="coerce")
+        # the ratings dataframe repeats some dates, so its rows drift from the date axis
+        row_days = rating_dates.values.astype("datetime64[D]")
+        row_positions = np.minimum(np.searchsorted(dates, row_days), len(dates) - 1)
+        row_positions[np.isnat(row_days) | (dates[row_positions] != row_days)] = -1
+        ratings = neighborhood_ratings.drop(columns="date").reindex(columns=neighborhoods)
+        ratings = ratings[rating_dates.notna().values]
+        rating_dates = rating_dates[rating_dates.notna()].values.astype("datetime64[D]")
+        rating_dates, rating_rows = np.unique(rating_dates, return_index=True)
+        aligned_ratings = np.full(predictions.shape, np.nan)
+        found = np.isin(dates, rating_dates)
+        aligned_ratings[found] = ratings.values[rating_rows][np.searchsorted(rating_dates, dates[found])]
+        return cls(dates, neighborhoods, predictions, aligned_ratings, city, rating_rows=row_positions)
+
+    @classmethod
+    def load(cls, data_dir, mmap_mode="r"):
+        """Opens forecast arrays saved in the columnar format without copying them into memory.
+
+        The matrices are memory mapped read-only, so every process serving the same files
+        shares the same physical pages. They are checked against the axes and hash recorded in
+        the sidecar, so arrays from another save are never paired with its dates.
+
+        Parameters
+        -----------
+        data_dir: directory with the .npy files and the forecast_meta.json sidecar
+        mmap_mode: numpy memory map mode, None to read the arrays into memory
+
+        Returns
+        --------
+        ForecastArrays
+
+        Raises
+        --------
+        ValueError if the arrays don't match the sidecar
+        """
+        with open(os.path.join(data_dir, META_FILE)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(data_dir, meta["files"][name]), mmap_mode=mmap_mode)
+            for name in ARRAYS
+        }
+        dates = np.array(meta["dates"], dtype="datetime64[D]")
+        shapes = {
+            "predictions": (len(dates), len(meta["neighborhoods"])),
+            "ratings": (len(dates), len(meta["neighborhoods"])),
+            "city": (len(dates),),
+        }
+        for name, shape in shapes.items():
+            if arrays[name].shape != shape:
+                raise ValueError(
+                    f"{meta['files'][name]} has shape {arrays[name].shape}, {META_FILE} expects {shape}"
+                )
+        if array_hash(arrays) != meta["version"]:
+            raise ValueError(f"The arrays in {data_dir} don't match version {meta['version']} of {META_FILE}")
+        return cls(
+            dates,
+            meta["neighborhoods"],
+            arrays["predictions"],
+            arrays["ratings"],
+            arrays["city"],
+            version=meta["version"],
+            rating_rows=meta.get("rating_rows"),
+        )
+
+    def save(self, data_dir, dtype=np.float32, sources=None):
+        """Writes the forecasts as .npy matrices with a json sidecar of the date and neighborhood axes.
+
+        The matrices are written under names carrying their version and the sidecar naming them
+        is swapped in last, so readers see either the old or the new snapshot, never arrays of
+        one with the dates of the other. Array files of older saves are removed afterwards,
+        except those of the sidecar just replaced, which readers may still be opening.
+
+        Parameters
+        -----------
+        data_dir: directory to write to
+        dtype: numpy dtype of the saved matrices
+        sources: dictionary of the names of the files the forecasts were converted from to their
+            sha1, kept in the sidecar so a later publish of those files can be told apart
+
+        Returns
+        --------
+        string of the version of the saved data
+        """
+        arrays = {name: np.ascontiguousarray(getattr(self, name), dtype=dtype) for name in ARRAYS}
+        version = array_hash(arrays)
+        meta_path = os.path.join(data_dir, META_FILE)
+        previous = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                previous = json.load(f).get("files", {})
+
+        files = {}
+        for name, values in arrays.items():
+            files[name] = f"{name}-{version}.npy"
+            tmp_path = os.path.join(data_dir, files[name] + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, values)
+            os.replace(tmp_path, os.path.join(data_dir, files[name]))
+        meta = {
+            "version": version,
+            "dates": self.dates.astype(str).tolist(),
+            "neighborhoods": self.neighborhoods,
+            "dtype": np.dtype(dtype).name,
+            "files": files,
+            "rating_rows": self.rating_rows.tolist(),
+            "sources": sources or {},
+        }
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+        keep = set(files.values()) | set(previous.values())
+        for filename in os.listdir(data_dir):
+            if ARRAY_FILE_PATTERN.match(filename) and filename not in keep:
+                os.remove(os.path.join(data_dir, filename))
+        return version
+
+    def date_slice(self, start=None, end=None):
+        """Returns the slice of the date axis between two dates, both inclusive.
+
+        Parameters
+        -----------
+        start: first date, None for the first forecast date
+        end: last date, None for the last forecast date
+
+        Returns
+        --------
+        slice
+        """
+        first = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start, "D"))
+        last = (
+            len(self.dates)
+            if end is None
+            else np.searchsorted(self.dates, np.datetime64(end, "D"), side="right")
+        )
+        return slice(int(first), int(max(first, last)))
+
+    def period(self, rows):
+        """Returns the total and mean predictions of a date range and the ratings of the means.
+
+        Ratings use the same scale as the daily ratings, 0.5 at a neighborhood's mean daily
+        prediction and 0.5 lower for every two standard deviations above it.
+
+        Parameters
+        -----------
+        rows: slice of the date axis, from date_slice
+
+        Returns
+        --------
+        dictionary of 'days', 'totals', 'means', 'ratings' (arrays by neighborhood), 'city_total' and 'city_mean'
+        """
+        days = rows.stop - rows.start
+        totals = self.cumulative_predictions[rows.stop] - self.cumulative_predictions[rows.start]
+        city_total = self.cumulative_city[rows.stop] - self.cumulative_city[rows.start]
+        means = totals / days
+        return {
+            "days": days,
+            "totals": totals,
+            "means": means,
+            "ratings": (self.prediction_means - means) / (self.prediction_stds * 2) + 0.5,
+            "city_total": float(city_total),
+            "city_mean": float(city_total / days),
+        }
+
+    def neighborhood_positions(self, names=None):
+        """Returns the column positions of neighborhoods.
+
+        Parameters
+        -----------
+        names: list of neighborhood names, None for every neighborhood
+
+        Returns
+        --------
+        array of integer column positions
+
+        Raises
+        --------
+        KeyError if a name isn't a forecast neighborhood
+        """
+        if names is None:
+            return np.arange(len(self.neighborhoods))
+        lookup = {name: i for i, name in enumerate(self.neighborhoods)}
+        unknown = [name for name in names if name not in lookup]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        return np.array([lookup[name] for name in names], dtype=np.int64)
+
+    def select(self, rows, columns, metrics):
+        """Returns the forecast arrays of a date slice and neighborhood columns.
+
+        Parameters
+        -----------
+        rows: slice of the date axis
+        columns: array of neighborhood column positions
+        metrics: list of metrics from 'predictions', 'ratings' and 'city'
+
+        Returns
+        --------
+        dictionary of metric names to arrays, plus the 'dates' array
+        """
+        selected = {"dates": self.dates[rows]}
+        if "predictions" in metrics:
+            selected["predictions"] = self.predictions[rows][:, columns]
+        if "ratings" in metrics:
+            selected["ratings"] = self.ratings[rows][:, columns]
+        if "city" in metrics:
+            selected["city"] = self.city[rows]
+        return selected
+
+
+def _json_values(values):
+    """Converts an array to a JSON list body, writing NaN as null.
+
+    float32 values are written with their shortest float32 repr, the digits to_csv writes,
+    rather than as the float64 they widen to.
+    """
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        values = values.astype(str).astype(np.float64)
+    values = np.asarray(values, dtype=object)
+    values[pd.isnull(values)] = None
+    return json.dumps(values.tolist(), separators=(",", ":"))[1:-1]
+
+
+def json_chunks(selected, neighborhoods, chunk_size=92):
+    """Yields a columnar JSON document of selected forecasts in chunks of dates.
+
+    Parameters
+    -----------
+    selected: dictionary returned by ForecastArrays.select
+    neighborhoods: list of the selected neighborhood names
+    chunk_size: number of dates per chunk
+
+    Returns
+    --------
+    generator of strings
+    """
+    dates = selected["dates"]
+    yield '{"neighborhoods":' + json.dumps(neighborhoods)
+    for field in ["dates", "city", "predictions", "ratings"]:
+        if field not in selected:
+            continue
+        values = dates.astype(str) if field == "dates" else selected[field]
+        yield ',"' + field + '":['
+        for start in range(0, len(dates), chunk_size):
+            yield ("," if start else "") + _json_values(values[start : start + chunk_size])
+        yield "]"
+    yield "}"
+
+
+def csv_chunks(selected, neighborhoods, chunk_size=92):
+    """Yields selected forecasts as long CSV rows (one per date and neighborhood) in chunks of dates.
+
+    Parameters
+    -----------
+    selected: dictionary returned by ForecastArrays.select
+    neighborhoods: list of the selected neighborhood names
+    chunk_size: number of dates per chunk
+
+    Returns
+    --------
+    generator of strings
+    """
+    dates = selected["dates"]
+    by_neighborhood = "predictions" in selected or "ratings" in selected
+    width = len(neighborhoods) if by_neighborhood else 1
+    if len(dates) == 0:
+        columns = ["date"] + (["neighborhood"] if by_neighborhood else [])
+        columns += [name for field, name in [("predictions", "prediction"), ("ratings", "rating"), ("city", "city")]
+                    if field in selected]
+        yield ",".join(columns) + "\n"
+    for start in range(0, len(dates), chunk_size):
+        rows = slice(start, start + chunk_size)
+        n = len(dates[rows])
+        chunk = {"date": np.repeat(dates[rows].astype(str), width)}
+        if by_neighborhood:
+            chunk["neighborhood"] = np.tile(np.array(neighborhoods, dtype=object), n)
+        if "predictions" in selected:
+            chunk["prediction"] = selected["predictions"][rows].ravel()
+        if "ratings" in selected:
+            chunk["rating"] = selected["ratings"][rows].ravel()
+        if "city" in selected:
+            chunk["city"] = np.repeat(selected["city"][rows], width)
+        yield pd.DataFrame(chunk).to_csv(index=False, header=start == 0)
+
+
+if __name__ == "__main__":
+    # converts the pickled dashboard data to the columnar format
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "dashboard_data"
+    pickles = ["city_predictions.pkl", "neighborhood_ratings.pkl", "neighborhood_predictions.pkl"]
+    forecasts = ForecastArrays.from_frames(*[pd.read_pickle(os.path.join(data_dir, filename)) for filename in pickles])
+    print(forecasts.save(data_dir, sources={filename: file_hash(os.path.join(data_dir, filename)) for filename in pickles}))
@@ -0,0 +1,322 @@
+import os
+import sys
+import gzip
+import json
+
+import numpy as np
+
+
+# name, Douglas-Peucker tolerance in degrees, quantization grid size, lowest zoom level served
+GEOMETRY_LEVELS = [
+    ("low", 0.0006, 10000, 0),
+    ("medium", 0.00015, 10000, 11),
+    ("high", 0.00004, 100000, 13),
+    ("full", 0.0, 100000, 15),
+]
+
+
+def quantize_rings(geojson, quantization):
+    """Snaps the polygon rings of a GeoJSON feature collection to an integer grid.
+
+    Parameters
+    -----------
+    geojson: dictionary of a GeoJSON FeatureCollection of Polygon and MultiPolygon features
+    quantization: integer number of grid steps across the bounding box
+
+    Returns
+    --------
+    tuple: list of features as lists of polygons as lists of rings as lists of (x, y) integer points,
+           dictionary of the TopoJSON transform
+    """
+    coords = np.array(
+        [
+            point
+            for feature in geojson["features"]
+            for polygon in _polygons(feature["geometry"])
+            for ring in polygon
+            for point in ring
+        ]
+    )
+    x0, y0 = coords.min(axis=0)
+    x1, y1 = coords.max(axis=0)
+    kx = (x1 - x0) / (quantization - 1) if x1 > x0 else 1.0
+    ky = (y1 - y0) / (quantization - 1) if y1 > y0 else 1.0
+
+    features = []
+    for feature in geojson["features"]:
+        polygons = []
+        for polygon in _polygons(feature["geometry"]):
+            rings = []
+            for ring in polygon:
+                ring = np.array(ring)
+                q = np.column_stack(
+                    [np.round((ring[:, 0] - x0) / kx), np.round((ring[:, 1] - y0) / ky)]
+                ).astype(np.int64)
+                # drop points that collapsed onto the previous point
+                keep = np.ones(len(q), dtype=bool)
+                keep[1:] = np.any(q[1:] != q[:-1], axis=1)
+                q = q[keep]
+                if len(q) >= 4:
+                    rings.append([tuple(p) for p in q[:-1]])
+            if rings:
+                polygons.append(rings)
+        features.append(polygons)
+    return features, {"scale": [kx, ky], "translate": [x0, y0]}
+
+
+def _polygons(geometry):
+    """Returns the list of polygons of a Polygon or MultiPolygon geometry."""
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def find_junctions(features):
+    """Finds the points where borders shared between rings start or end.
+
+    A point is a junction when it is seen with a different pair of neighboring points in
+    different rings, so every shared border runs between two junctions.
+
+    Parameters
+    -----------
+    features: list of quantized features from quantize_rings
+
+    Returns
+    --------
+    set of (x, y) integer points
+    """
+    neighbors = {}
+    junctions = set()
+    for polygons in features:
+        for rings in polygons:
+            for ring in rings:
+                n = len(ring)
+                for i, point in enumerate(ring):
+                    pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+                    seen = neighbors.setdefault(point, pair)
+                    if seen != pair:
+                        junctions.add(point)
+    return junctions
+
+
+def cut_arcs(features, junctions):
+    """Splits every ring at junctions into arcs, storing each shared border only once.
+
+    Parameters
+    -----------
+    features: list of quantized features from quantize_rings
+    junctions: set of junction points from find_junctions
+
+    Returns
+    --------
+    tuple: list of arcs as lists of (x, y) integer points,
+           list of features as lists of polygons as lists of rings as lists of arc indexes
+           (negative indexes ~i refer to arc i reversed)
+    """
+    arcs = []
+    arc_index = {}
+    topology = []
+    for polygons in features:
+        feature_arcs = []
+        for rings in polygons:
+            polygon_arcs = []
+            for ring in rings:
+                starts = [i for i, point in enumerate(ring) if point in junctions]
+                if starts:
+                    ring = ring[starts[0]:] + ring[: starts[0]]
+                    starts = [i - starts[0] for i in starts]
+                else:
+                    # a ring with no shared border, rotate so identical rings match
+                    first = ring.index(min(ring))
+                    ring = ring[first:] + ring[:first]
+                    starts = [0]
+                ring = ring + [ring[0]]
+                ring_arcs = []
+                for start, end in zip(starts, starts[1:] + [len(ring) - 1]):
+                    arc = tuple(ring[start : end + 1])
+                    if arc in arc_index:
+                        ring_arcs.append(arc_index[arc])
+                    elif arc[::-1] in arc_index:
+                        ring_arcs.append(~arc_index[arc[::-1]])
+                    else:
+                        arc_index[arc] = len(arcs)
+                        ring_arcs.append(len(arcs))
+                        arcs.append(list(arc))
+                polygon_arcs.append(ring_arcs)
+            feature_arcs.append(polygon_arcs)
+        topology.append(feature_arcs)
+    return arcs, topology
+
+
+def simplify_arc(points, tolerance):
+    """Simplifies a line with the Douglas-Peucker algorithm, keeping both end points.
+
+    Parameters
+    -----------
+    points: array of (x, y) points
+    tolerance: maximum distance a removed point may be from the simplified line
+
+    Returns
+    --------
+    array of the kept points
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if tolerance <= 0 or n <= 2:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    if np.all(points[0] == points[-1]):
+        # closed ring, anchor on the point farthest from the start so it isn't a single line
+        far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+        keep[far] = True
+        stack = [(0, far), (far, n - 1)]
+    else:
+        stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = points[start]
+        b = points[end]
+        segment = points[start + 1 : end]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(*(segment - a).T)
+        else:
+            dist = np.abs(dx * (segment[:, 1] - a[1]) - dy * (segment[:, 0] - a[0])) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return points[keep]
+
+
+def build_topology(geojson, tolerance, quantization, object_name="neighborhoods"):
+    """Creates a simplified, quantized TopoJSON topology from a GeoJSON feature collection.
+
+    Parameters
+    -----------
+    geojson: dictionary of a GeoJSON FeatureCollection
+    tolerance: Douglas-Peucker tolerance in degrees, 0 keeps every point
+    quantization: integer number of grid steps across the bounding box
+    object_name: name of the geometry collection in the topology
+
+    Returns
+    --------
+    tuple: dictionary of the TopoJSON topology, integer count of vertices kept
+    """
+    features, transform = quantize_rings(geojson, quantization)
+    arcs, topology = cut_arcs(features, find_junctions(features))
+    kx, ky = transform["scale"]
+
+    encoded_arcs = []
+    vertices = 0
+    for arc in arcs:
+        arc = np.array(arc, dtype=float)
+        # simplify in degrees so the tolerance doesn't depend on the quantization
+        simplified = simplify_arc(arc * [kx, ky], tolerance) / [kx, ky]
+        simplified = np.round(simplified).astype(np.int64)
+        vertices += len(simplified)
+        deltas = np.vstack([simplified[:1], np.diff(simplified, axis=0)])
+        encoded_arcs.append(deltas.tolist())
+
+    geometries = []
+    for feature, polygons in zip(geojson["features"], topology):
+        geometries.append(
+            {
+                "type": "MultiPolygon",
+                "properties": {"name": feature["properties"]["name"]},
+                "arcs": polygons,
+            }
+        )
+    x0, y0 = transform["translate"]
+    topo = {
+        "type": "Topology",
+        "transform": transform,
+        "bbox": [x0, y0, x0 + kx * (quantization - 1), y0 + ky * (quantization - 1)],
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded_arcs,
+    }
+    return topo, vertices
+
+
+def geometry_filename(level):
+    """Returns the file name of the topology built for a simplification level."""
+    return f"seattle_neighborhoods_{level}.topojson"
+
+
+def build_geometry_levels(
+    geojson_path="dashboard_data/seattle_neighborhood_shapes.geojson",
+    output_dir="dashboard_data/geometry",
+    levels=GEOMETRY_LEVELS,
+):
+    """Writes a TopoJSON file for each simplification level and returns a size report.
+
+    Parameters
+    -----------
+    geojson_path: location of the full precision neighborhood GeoJSON file
+    output_dir: directory the TopoJSON files are written to
+    levels: list of tuples (name, tolerance, quantization, lowest zoom level)
+
+    Returns
+    --------
+    list of dictionaries with the vertex count and payload size of each level
+    """
+    with open(geojson_path) as f:
+        geojson = json.load(f)
+    with open(geojson_path, "rb") as f:
+        raw = f.read()
+    report = [
+        {
+            "level": "geojson",
+            "tolerance": 0.0,
+            "quantization": None,
+            "min_zoom": None,
+            "vertices": sum(
+                len(ring)
+                for feature in geojson["features"]
+                for polygon in _polygons(feature["geometry"])
+                for ring in polygon
+            ),
+            "bytes": len(raw),
+            "gzip_bytes": len(gzip.compress(raw)),
+        }
+    ]
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name, tolerance, quantization, min_zoom in levels:
+        topo, vertices = build_topology(geojson, tolerance, quantization)
+        payload = json.dumps(topo, separators=(",", ":")).encode("utf-8")
+        with open(os.path.join(output_dir, geometry_filename(name)), "wb") as f:
+            f.write(payload)
+        report.append(
+            {
+                "level": name,
+                "tolerance": tolerance,
+                "quantization": quantization,
+                "min_zoom": min_zoom,
+                "vertices": vertices,
+                "bytes": len(payload),
+                "gzip_bytes": len(gzip.compress(payload)),
+            }
+        )
+
+    with open(os.path.join(output_dir, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    report = build_geometry_levels(*sys.argv[1:3])
+    print(f"{'level':<10}{'tolerance':>12}{'vertices':>10}{'bytes':>10}{'gzip':>10}")
+    for row in report:
+        print(
+            f"{row['level']:<10}{row['tolerance']:>12}{row['vertices']:>10}"
+            f"{row['bytes']:>10}{row['gzip_bytes']:>10}"
+        )
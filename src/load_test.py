@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# route names and the paths they request, landing (/), date (/<date_str>), map (/map/<index>), table (/table/<date_str>)
+ROUTES = ["landing", "date", "map", "table"]
+
+
+def sample_dates(dates, n, hot_days=14, hot_share=0.8, seed=0):
+    """Draws request dates the way visitors spread over the forecast calendar.
+
+    Most visits ask about the days around the newest forecasts, the rest look anywhere
+    in the calendar.
+
+    Parameters
+    -----------
+    dates: array of datetime64[D] forecast dates, sorted
+    n: number of dates to draw
+    hot_days: number of newest dates that get the hot share of the traffic
+    hot_share: share of requests for the newest dates
+    seed: random seed so runs are comparable
+
+    Returns
+    --------
+    array of row positions in dates
+    """
+    rng = np.random.default_rng(seed)
+    hot = rng.random(n) < hot_share
+    positions = rng.integers(0, len(dates), size=n)
+    hot_days = min(hot_days, len(dates))
+    positions[hot] = len(dates) - 1 - rng.integers(0, hot_days, size=hot.sum())
+    return positions
+
+
+def map_indexes(rating_rows, num_dates):
+    """Returns the /map/<index> of each date, its first row of the ratings dataframe, -1 if it has none.
+
+    Parameters
+    -----------
+    rating_rows: array of the date position of each ratings row, ForecastArrays.rating_rows
+    num_dates: number of forecast dates
+
+    Returns
+    --------
+    array of integers
+    """
+    indexes = np.full(num_dates, -1, dtype=np.int64)
+    rows = np.flatnonzero(rating_rows >= 0)[::-1]
+    indexes[rating_rows[rows]] = rows
+    return indexes
+
+
+def build_requests(dates, routes, n, seed=0, maps=None):
+    """Builds the list of (route, path) requests of a run.
+
+    Parameters
+    -----------
+    dates: array of datetime64[D] forecast dates, sorted
+    routes: list of route names from ROUTES
+    n: number of requests
+    seed: random seed
+    maps: array of the /map/<index> of each date from map_indexes, defaults to the date positions
+
+    Returns
+    --------
+    list of tuples
+    """
+    positions = sample_dates(dates, n, seed=seed)
+    maps = np.arange(len(dates)) if maps is None else maps
+    rng = np.random.default_rng(seed + 1)
+    requests = []
+    for position, route in zip(positions, rng.choice(routes, size=n)):
+        date = dates[position].astype(object)
+        if route == "landing":
+            # renders today's forecast, a 404 when today is outside the calendar
+            path = "/"
+        elif route == "date":
+            path = "/" + date.strftime("%m-%d-%Y")
+        elif route == "table":
+            path = "/table/" + date.isoformat()
+        else:
+            path = "/map/" + str(maps[position])
+        requests.append((route, path))
+    return requests
+
+
+def in_process_client(app):
+    """Returns a function sending a request through the flask test client, no sockets involved."""
+    local = threading.local()
+
+    def send(path, headers):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        response = local.client.get(path, headers=headers)
+        return response.status_code, len(response.data)
+
+    return send
+
+
+def http_client(base_url):
+    """Returns a function sending a request over http to a running server."""
+
+    def send(path, headers):
+        request = urllib.request.Request(base_url + path, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, len(error.read())
+
+    return send
+
+
+def start_local_server(app, port=0):
+    """Serves the app with werkzeug's threaded wsgi server on a daemon thread.
+
+    Returns
+    --------
+    tuple of the server and its base url
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in megabytes.
+
+    This is the app's memory when it serves in this process, and only the load generator's
+    when requests go to a --url.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies, sizes, statuses, elapsed):
+    """Returns latency percentiles, throughput and sizes of a group of requests.
+
+    Parameters
+    -----------
+    latencies: array of request latencies in seconds
+    sizes: array of response sizes in bytes
+    statuses: array of response status codes
+    elapsed: wall clock seconds of the run
+
+    Returns
+    --------
+    dictionary
+    """
+    if len(latencies) == 0:
+        return {"requests": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "requests": int(len(latencies)),
+        "errors": int((statuses >= 500).sum()),
+        "not_found": int((statuses == 404).sum()),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(float(latencies.mean()) * 1000, 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(latencies.max()) * 1000, 3),
+        "mean_bytes": int(sizes.mean()),
+        "total_bytes": int(sizes.sum()),
+    }
+
+
+def run(send, requests, concurrency=8, headers=None):
+    """Sends requests from a pool of workers and times each one.
+
+    Parameters
+    -----------
+    send: function sending a path with headers, returning the status code and body size
+    requests: list of (route, path) tuples
+    concurrency: number of requests in flight
+    headers: dictionary of request headers
+
+    Returns
+    --------
+    dictionary of the overall and per route summaries
+    """
+    headers = headers or {}
+
+    def timed(request):
+        start = time.perf_counter()
+        status, size = send(request[1], headers)
+        return time.perf_counter() - start, size, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, requests))
+    elapsed = time.perf_counter() - start
+
+    latencies, sizes, statuses = (np.array(values) for values in zip(*results))
+    routes = np.array([route for route, path in requests])
+    summary = {"elapsed_s": round(elapsed, 3), "all": summarize(latencies, sizes, statuses, elapsed)}
+    for route in sorted(set(routes)):
+        found = routes == route
+        summary[route] = summarize(latencies[found], sizes[found], statuses[found], elapsed)
+    return summary
+
+
+def git_commit():
+    """Returns the current git commit of the repository, None outside a checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the dashboard routes.")
+    parser.add_argument("--mode", choices=["in-process", "server"], default="in-process",
+                        help="flask test client, or a local threaded wsgi server over http")
+    parser.add_argument("--url", help="base url of an already running dashboard, instead of starting one")
+    # landing renders today's forecast, which is a 404 once today is past the forecast calendar
+    parser.add_argument("--routes", default="date,map,table",
+                        help="comma separated routes from " + ", ".join(ROUTES))
+    parser.add_argument("--requests", type=int, default=500, help="number of timed requests")
+    parser.add_argument("--warmup", type=int, default=0, help="untimed requests sent first to fill caches")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--encoding", default="gzip", help="Accept-Encoding header, empty for none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="json file the results are written to")
+    args = parser.parse_args(argv)
+
+    routes = args.routes.split(",")
+    if not set(routes) <= set(ROUTES):
+        parser.error("routes must be from " + ", ".join(ROUTES))
+
+    sys.path.insert(0, os.getcwd())
+    started = time.perf_counter()
+    import app as dashboard
+    load_s = time.perf_counter() - started
+
+    if args.url:
+        send = http_client(args.url.rstrip("/"))
+    elif args.mode == "server":
+        server, base_url = start_local_server(dashboard.app)
+        send = http_client(base_url)
+    else:
+        send = in_process_client(dashboard.app)
+
+    forecast_arrays = dashboard.snapshots.current.forecast_arrays
+    dates = forecast_arrays.dates
+    maps = map_indexes(forecast_arrays.rating_rows, len(dates))
+    headers = {"Accept-Encoding": args.encoding}
+    if args.warmup:
+        run(send, build_requests(dates, routes, args.warmup, seed=args.seed + 1000, maps=maps),
+            args.concurrency, headers)
+    summary = run(send, build_requests(dates, routes, args.requests, seed=args.seed, maps=maps),
+                  args.concurrency, headers)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "snapshot": dashboard.snapshots.current.version,
+    }
+    if args.url:
+        # the server runs in another process, the memory measured here is only the load generator's
+        results["load_generator_peak_rss_mb"] = round(peak_rss_mb(), 1)
+    else:
+        results["app_load_s"] = round(load_s, 3)
+        results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    results["results"] = summary
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class MapCache:
+    """Bounded least recently used cache of rendered map html keyed by data version and date index.
+
+    Attributes
+    -----------
+    maxsize: maximum number of maps held in memory
+    cache_dir: optional directory where rendered maps are also written so they survive restarts
+    build: string identifying the code rendering the maps, maps on disk from other builds aren't read
+    hits: number of lookups answered from memory or disk
+    misses: number of lookups that had to render the map
+    """
+
+    def __init__(self, maxsize=128, cache_dir=None, build=""):
+        """The constructor for MapCache class.
+
+        Parameters
+        -----------
+        maxsize: maximum number of maps held in memory
+        cache_dir: optional directory where rendered maps are also written so they survive restarts
+        build: string identifying the code rendering the maps, such as a hash of the code and templates
+        """
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.build = build
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, date_idx, render):
+        """Returns the map html for a date index, rendering and storing it if it isn't cached.
+
+        Parameters
+        -----------
+        version: string identifying the dashboard data the map is rendered from
+        date_idx: integer row position of the date in the ratings dataframe
+        render: function returning the map html as bytes
+
+        Returns
+        --------
+        bytes
+        """
+        key = (version, date_idx)
+        with self._lock:
+            if key in self._maps:
+                self._maps.move_to_end(key)
+                self.hits += 1
+                return self._maps[key]
+
+        html = self._read_disk(key)
+        if html is not None:
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+        else:
+            html = render()
+            self._write_disk(key, html)
+            with self._lock:
+                self.misses += 1
+        self._store(key, html)
+        return html
+
+    def clear(self):
+        """Empties the in-memory cache and resets the counters. Files on disk are kept."""
+        with self._lock:
+            self._maps.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Returns a dictionary of cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._maps),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _store(self, key, html):
+        """Adds a map to memory, evicting the least recently used maps past maxsize."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._maps[key] = html
+            self._maps.move_to_end(key)
+            while len(self._maps) > self.maxsize:
+                self._maps.popitem(last=False)
+
+    def _disk_path(self, key):
+        """Returns the file path of a cached map, None if the cache isn't backed by disk."""
+        if self.cache_dir is None:
+            return None
+        version, date_idx = key
+        # maps rendered by other code outlive a restart on disk, so the build is part of the path
+        return os.path.join(self.cache_dir, f"{version}-{self.build}" if self.build else version, f"map_{date_idx}.html")
+
+    def _read_disk(self, key):
+        """Reads a cached map from disk, None if it isn't there."""
+        path = self._disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _write_disk(self, key, html):
+        """Writes a rendered map to disk, replacing the file atomically."""
+        path = self._disk_path(key)
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(html)
+        os.replace(tmp_path, path)
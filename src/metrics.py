@@ -0,0 +1,219 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+
+# latency buckets in seconds, from cached lookups to cold folium renders
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+# response size buckets in bytes, from 304s to uncompressed folium maps
+SIZE_BUCKETS = [100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000]
+
+
+def _format_labels(names, values):
+    """Formats label names and values as a Prometheus label set."""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    """Formats a sample value, writing whole numbers without a decimal point."""
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with labels.
+
+    Attributes
+    -----------
+    name: metric name
+    documentation: help text of the metric
+    label_names: tuple of label names
+    """
+
+    def __init__(self, name, documentation, label_names=()):
+        """The constructor for Counter class.
+
+        Parameters
+        -----------
+        name: metric name
+        documentation: help text of the metric
+        label_names: tuple of label names
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Adds an amount to the counter of a label set."""
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        """Returns the lines of the metric in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with labels, in the Prometheus histogram layout.
+
+    Observations only bisect the bucket bounds and increment a few integers, so timing
+    a request costs a couple of microseconds.
+
+    Attributes
+    -----------
+    name: metric name
+    documentation: help text of the metric
+    label_names: tuple of label names
+    buckets: list of upper bucket bounds, sorted
+    """
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        """The constructor for Histogram class.
+
+        Parameters
+        -----------
+        name: metric name
+        documentation: help text of the metric
+        label_names: tuple of label names
+        buckets: list of upper bucket bounds
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = sorted(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Records an observation for a label set."""
+        key = tuple(labels[name] for name in self.label_names)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # bucket counts, then the +Inf count and the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[position] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager observing the seconds spent inside it."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        """Returns the lines of the metric in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(bounds, counts[:-1]):
+                cumulative += count
+                labels = _format_labels(self.label_names + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauges:
+    """Gauges read from a function when the metrics are scraped.
+
+    Attributes
+    -----------
+    name: metric name
+    documentation: help text of the metric
+    label_names: tuple of label names
+    read: function returning a list of (label values tuple, value)
+    """
+
+    def __init__(self, name, documentation, label_names, read):
+        """The constructor for Gauges class.
+
+        Parameters
+        -----------
+        name: metric name
+        documentation: help text of the metric
+        label_names: tuple of label names
+        read: function returning a list of (label values tuple, value)
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.read = read
+
+    def collect(self):
+        """Returns the lines of the metric in Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in self.read():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics exposed together in Prometheus text format."""
+
+    def __init__(self):
+        """The constructor for MetricsRegistry class."""
+        self.metrics = []
+
+    def register(self, metric):
+        """Adds a metric to the registry and returns it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns every metric in Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+def cache_stats_gauges(caches):
+    """Returns gauge reading functions for the hits, misses and hit ratios of named caches.
+
+    Parameters
+    -----------
+    caches: dictionary of cache names to functions returning a dictionary with hits and misses
+
+    Returns
+    --------
+    tuple of functions reading hits, misses and hit ratio
+    """
+
+    def read(field):
+        samples = []
+        for name, stats in caches.items():
+            values = stats()
+            lookups = values["hits"] + values["misses"]
+            if field == "hit_ratio":
+                samples.append(((name,), values["hits"] / lookups if lookups else 0.0))
+            else:
+                samples.append(((name,), values[field]))
+        return samples
+
+    return (lambda: read("hits"), lambda: read("misses"), lambda: read("hit_ratio"))
@@ -10,6 +10,7 @@ from src.weather_scraper import (
 )
 from src.data_retrievers import DataRetrieval
 from src.holiday_calendars import SeattleHolidays
+from src.sparse_design import SparseDesign
 from src.featurizers import (
     CountCalls,
     FeaturizeCalls,
@@ -28,17 +29,36 @@ from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 
 
-def calls_pipe(calls_df):
+def calls_pipe(calls_df, sparse=False):
     """Creates pipeline and dataframe for model input.
     
     Parameters
     -----------
-    calls_df: dataframe of Calls for Service data
+    calls_df: dataframe of Calls for Service data, or CallCounts of calls already counted
+    sparse: build the features as a SparseDesign, one row per date of targets, whose matrix the models train on
 
     Returns
     --------
-    tuple: dataframe of targets, dataframe of features
+    tuple: dataframe of targets, dataframe or SparseDesign of features
     """
+    if sparse:
+        counts = CountCalls(how="neighborhood", dense=True).fit(calls_df).transform()
+        dates = pd.DatetimeIndex(counts.dates).date
+        targets = pd.DataFrame(
+            counts.counts.astype(np.float64),
+            index=pd.Index(dates, name="date"),
+            columns=pd.Index(counts.neighborhoods, name="neighborhood"),
+        )
+        features_pipe = Pipeline(
+            steps=[
+                ("feturizer", FeaturizeCalls()),
+                ("date_dummifier", DateDummies(sparse=True)),
+                ("model_input", MakeModelInput(sparse=True)),
+            ]
+        )
+        features_pipe.fit(pd.DataFrame({"date": dates}))
+        return targets, features_pipe.transform(None)
+
     calls_pipe = Pipeline(
         steps=[
             ("counter", CountCalls(how="neighborhood")),
@@ -70,7 +90,7 @@ def calls_pipe(calls_df):
     return targets, features
 
 
-def forecast_pipe(start_date, end_date, model_end):
+def forecast_pipe(start_date, end_date, model_end, sparse=False):
     """Creates pipeline and dataframe for forecast.
     
     Parameters
@@ -78,16 +98,17 @@ def forecast_pipe(start_date, end_date, model_end):
     start_date: string of the start date ('mm/dd/yyyy')
     end_date: string of the end date ('mm/dd/yyyy')
     model_end: tuple (string of the last date ('mm/dd/yyyy')used in model, integer of the last day sequence used in model)
+    sparse: build the features as a SparseDesign, use its reindex to match the columns the models were trained on
 
     Returns
     --------
-    dataframe: dataframe of features for forecast
+    dataframe: dataframe or SparseDesign of features for forecast
     """
     forecast_pipe = Pipeline(
         steps=[
             ('date_featurizer', FeaturizeDates(start_date, end_date, model_end)),
-            ('date_dummifier', DateDummies()),
-            ('model_input', MakeModelInput()),
+            ('date_dummifier', DateDummies(sparse=sparse)),
+            ('model_input', MakeModelInput(sparse=sparse)),
             ('add_weather', AddWeatherForecast()),
         ]
     )
@@ -101,7 +122,7 @@ def baseline_model(X_train, y_train):
     
     Parameters
     -----------
-    X_train: Dataframe of features for training model
+    X_train: Dataframe or sparse matrix of features for training model
     y_train: Dataframe of targets for training model
 
 
@@ -119,7 +140,7 @@ def city_model(X_train, y_train):
     
     Parameters
     -----------
-    X_train: Dataframe of features for training model
+    X_train: Dataframe or sparse matrix of features for training model
     y_train: Dataframe of targets for training model
 
     Returns
@@ -138,7 +159,7 @@ def neighborhood_dist_model(X_train, y_train):
     
     Parameters
     -----------
-    X_train: Dataframe of features for training model
+    X_train: Dataframe or sparse matrix of features for training model
     y_train: Dataframe of targets for training model
 
     Returns
@@ -167,7 +188,7 @@ def model_ensemble(city_counts, neighborhood_dist, features, targets):
     -----------
     city_counts: Dataframe results from city model
     neighborhood_dist: Dataframe of results from neighborhood distribution model
-    features: Dataframe of features used in forecast
+    features: Dataframe or SparseDesign of features used in forecast
     targets: Dataframe of targets used in model
 
     Returns
@@ -177,5 +198,8 @@ def model_ensemble(city_counts, neighborhood_dist, features, targets):
     predictions = (city_counts * neighborhood_dist.T)
     predictions = pd.DataFrame(predictions).T
     predictions.columns = targets.columns
-    predictions['date'] = features['date'].values
+    if isinstance(features, SparseDesign):
+        predictions['date'] = pd.DatetimeIndex(features.dates).date
+    else:
+        predictions['date'] = features['date'].values
     return predictions
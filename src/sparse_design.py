@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def _days(dates):
+    """Returns datetime64[D] days of datetime.date, datetime64 or date string values."""
+    return pd.to_datetime(pd.Index(dates)).values.astype("datetime64[D]")
+
+
+class SparseDesign:
+    """Model features as a CSR matrix with one row per date and named columns.
+
+    The sparse counterpart of the dummy dataframes joined on date: dummy columns hold only
+    their ones, and rows are dates rather than rows of a long neighborhood x day frame.
+
+    Attributes
+    -----------
+    dates: datetime64[D] array of the date of each row, without repeats
+    columns: list of column names
+    matrix: scipy.sparse CSR matrix (dates x columns) of float64 values
+    """
+
+    def __init__(self, dates, columns, matrix):
+        """The constructor for SparseDesign class.
+
+        Parameters
+        -----------
+        dates: array-like of the date of each row
+        columns: list of column names
+        matrix: scipy.sparse matrix or array (dates x columns)
+        """
+        self.dates = _days(dates)
+        self.columns = list(columns)
+        self.matrix = sparse.csr_matrix(matrix, shape=(len(self.dates), len(self.columns)), dtype=np.float64)
+
+    @classmethod
+    def from_frame(cls, frame, date_column="date", dummies=None):
+        """Creates a design from the numeric columns of a dataframe keyed by date.
+
+        A design has one row per date, where a left join on date keeps every row of a repeated
+        date. Rows of a repeated date are combined only in dummy columns, by their maximum,
+        which sets each dummy the date has as the sparse dummy transformers do. Other columns
+        can't hold two values for one date, so a repeated date with differing values in them
+        raises a ValueError. Missing values are zeros.
+
+        Parameters
+        -----------
+        frame: dataframe with a date column
+        date_column: name of the date column
+        dummies: list of the dummy columns, defaults to the columns holding only zeros and ones
+
+        Returns
+        --------
+        SparseDesign
+
+        Raises
+        --------
+        ValueError if a repeated date has differing values in a column that isn't a dummy
+        """
+        values = frame.drop(columns=date_column).astype(np.float64).fillna(0)
+        if dummies is None:
+            dummies = [column for column in values.columns if values[column].isin([0.0, 1.0]).all()]
+        grouped = values.groupby(_days(frame[date_column]), sort=False)
+        combined = grouped.max()
+        others = [column for column in values.columns if column not in dummies]
+        if others and len(combined) < len(values):
+            differing = combined[others].ne(grouped[others].min())
+            if differing.values.any():
+                raise ValueError(
+                    f"Dates {', '.join(combined.index[differing.any(axis=1)].astype(str)[:5])} have several "
+                    f"values of {', '.join(differing.columns[differing.any(axis=0)])}, which one row per date can't hold"
+                )
+        return cls(combined.index, combined.columns, sparse.csr_matrix(combined.values))
+
+    @classmethod
+    def from_dummies(cls, dates, values, prefix, vocabulary=None):
+        """Creates dummy columns of a categorical value, one row per date.
+
+        Columns are named like pd.get_dummies, prefix_value, in vocabulary order. A date
+        with several values has a one in each of their columns.
+
+        Parameters
+        -----------
+        dates: array-like of the date of each value
+        values: array-like of values, missing values have no column
+        prefix: prefix of the column names
+        vocabulary: list of the values with a column, defaults to the sorted values seen.
+            Values outside the vocabulary have no column
+
+        Returns
+        --------
+        SparseDesign
+        """
+        values = pd.Series(np.asarray(values, dtype=object))
+        if vocabulary is None:
+            vocabulary = sorted(values.dropna().unique())
+        rows, row_dates = pd.factorize(_days(dates))
+        codes = pd.Index(vocabulary).get_indexer(values)
+        present = codes >= 0
+        matrix = sparse.csr_matrix(
+            (np.ones(present.sum()), (rows[present], codes[present])),
+            shape=(len(row_dates), len(vocabulary)),
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.0
+        return cls(row_dates, [f"{prefix}_{value}" for value in vocabulary], matrix)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nbytes(self):
+        """Returns the number of bytes held by the matrix."""
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def join(self, *others):
+        """Left joins designs on date, dates missing from another design get zeros in its columns.
+
+        Parameters
+        -----------
+        others: SparseDesigns
+
+        Returns
+        --------
+        SparseDesign with the rows of this design and the columns of every design
+        """
+        blocks = [self.matrix]
+        columns = list(self.columns)
+        for other in others:
+            positions = pd.Index(other.dates).get_indexer(self.dates)
+            matched = np.flatnonzero(positions >= 0)
+            selector = sparse.csr_matrix(
+                (np.ones(len(matched)), (matched, positions[matched])),
+                shape=(len(self.dates), len(other.dates)),
+            )
+            blocks.append(selector @ other.matrix)
+            columns += other.columns
+        return SparseDesign(self.dates, columns, sparse.hstack(blocks, format="csr"))
+
+    def reindex(self, columns):
+        """Returns the design with exactly the given columns, zeros for columns it doesn't have.
+
+        Parameters
+        -----------
+        columns: list of column names, such as the columns a model was trained on
+
+        Returns
+        --------
+        SparseDesign
+        """
+        positions = pd.Index(self.columns).get_indexer(columns)
+        matched = np.flatnonzero(positions >= 0)
+        selector = sparse.csr_matrix(
+            (np.ones(len(matched)), (positions[matched], matched)),
+            shape=(len(self.columns), len(columns)),
+        )
+        return SparseDesign(self.dates, columns, self.matrix @ selector)
+
+    def assign(self, frame):
+        """Returns the design with columns replaced or added from a dataframe with a row per date.
+
+        Parameters
+        -----------
+        frame: dataframe of numeric columns in the order of dates
+
+        Returns
+        --------
+        SparseDesign
+        """
+        columns = list(self.columns) + [column for column in frame.columns if column not in self.columns]
+        positions = pd.Index(columns).get_indexer(frame.columns)
+        keep = np.ones(len(columns))
+        keep[positions] = 0.0
+        matrix = sparse.hstack(
+            [self.matrix, sparse.csr_matrix((len(self.dates), len(columns) - len(self.columns)))], format="csr"
+        )
+        values = frame.astype(np.float64).fillna(0).values
+        rows, cols = np.nonzero(values)
+        replaced = sparse.csr_matrix(
+            (values[rows, cols], (rows, positions[cols])), shape=(len(self.dates), len(columns))
+        )
+        return SparseDesign(self.dates, columns, matrix @ sparse.diags(keep) + replaced)
+
+    def to_frame(self):
+        """Returns the design as a dense dataframe with a date column."""
+        frame = pd.DataFrame(self.matrix.toarray(), columns=self.columns)
+        frame.insert(0, "date", pd.DatetimeIndex(self.dates).date)
+        return frame
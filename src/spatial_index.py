@@ -0,0 +1,145 @@
+import json
+
+import numpy as np
+
+
+def _polygons(geometry):
+    """Returns the polygons of a Polygon or MultiPolygon geometry as lists of rings."""
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return []
+
+
+class SpatialIndex:
+    """Point to neighborhood lookups over the polygons of a GeoJSON feature collection.
+
+    Feature bounding boxes are bucketed into a uniform grid over the city, so a point is
+    only tested against the few neighborhoods whose boxes overlap its grid cell. Points are
+    tested in bulk with a vectorized even-odd crossing test against the edges of each
+    candidate neighborhood, which also handles holes and multipolygons. Everything is held
+    in numpy arrays.
+
+    Attributes
+    -----------
+    names: list of feature names in GeoJSON feature order
+    bounds: array (features x 4) of feature bounding boxes as min lon, min lat, max lon, max lat
+    """
+
+    def __init__(self, geojson, grid_size=32, max_tests=4000000):
+        """The constructor for SpatialIndex class.
+
+        Parameters
+        -----------
+        geojson: dictionary, string or bytes of a GeoJSON feature collection
+        grid_size: number of grid cells along each axis
+        max_tests: maximum number of point and edge pairs tested at once, bounds the memory of bulk lookups
+        """
+        if isinstance(geojson, (str, bytes)):
+            geojson = json.loads(geojson)
+        self.names = []
+        self.max_tests = max_tests
+        bounds, edges, edge_offsets = [], [], [0]
+        for feature in geojson["features"]:
+            self.names.append(feature["properties"]["name"])
+            rings = [np.asarray(ring, dtype=np.float64)[:, :2]
+                     for polygon in _polygons(feature["geometry"]) for ring in polygon]
+            feature_edges = [np.hstack([ring[:-1], ring[1:]]) for ring in rings if len(ring) > 1]
+            feature_edges = np.vstack(feature_edges) if feature_edges else np.empty((0, 4))
+            edges.append(feature_edges)
+            edge_offsets.append(edge_offsets[-1] + len(feature_edges))
+            if len(feature_edges):
+                points = feature_edges[:, :2]
+                bounds.append(np.concatenate([points.min(axis=0), points.max(axis=0)]))
+            else:
+                bounds.append(np.array([np.inf, np.inf, -np.inf, -np.inf]))
+        self.bounds = np.array(bounds).reshape(-1, 4)
+        self._edges = np.vstack(edges) if edges else np.empty((0, 4))
+        self._edge_offsets = np.array(edge_offsets)
+
+        # grid over the extent of every feature, each cell lists the features whose boxes overlap it
+        finite = np.isfinite(self.bounds).all(axis=1)
+        if finite.any():
+            self._origin = self.bounds[finite, :2].min(axis=0)
+            extent = self.bounds[finite, 2:].max(axis=0) - self._origin
+        else:
+            self._origin, extent = np.zeros(2), np.ones(2)
+        self._grid_size = grid_size
+        self._cell_size = np.where(extent > 0, extent / grid_size, 1.0)
+        cells = [[] for _ in range(grid_size * grid_size)]
+        for feature in np.flatnonzero(finite):
+            (x0, y0), (x1, y1) = self._cell(self.bounds[feature, :2]), self._cell(self.bounds[feature, 2:])
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    cells[x * grid_size + y].append(feature)
+        self._cell_offsets = np.cumsum([0] + [len(cell) for cell in cells])
+        self._cell_features = np.array([feature for cell in cells for feature in cell], dtype=np.int64)
+
+    def _cell(self, point):
+        """Returns the grid column and row of a point, clipped to the grid."""
+        cell = np.floor((np.asarray(point) - self._origin) / self._cell_size).astype(np.int64)
+        return np.clip(cell, 0, self._grid_size - 1)
+
+    def locate(self, lon, lat):
+        """Finds the feature containing each point.
+
+        Parameters
+        -----------
+        lon: array of longitudes
+        lat: array of latitudes
+
+        Returns
+        --------
+        array of feature positions in names, -1 for points outside every feature
+        """
+        points = np.column_stack([np.asarray(lon, dtype=np.float64).ravel(),
+                                  np.asarray(lat, dtype=np.float64).ravel()])
+        found = np.full(len(points), -1, dtype=np.int64)
+        valid = np.isfinite(points).all(axis=1)
+        cells = self._cell(points[valid]) if valid.any() else np.empty((0, 2), dtype=np.int64)
+        cell_ids = np.full(len(points), -1, dtype=np.int64)
+        cell_ids[valid] = cells[:, 0] * self._grid_size + cells[:, 1]
+        # points off the grid can't be in any feature
+        inside_grid = valid.copy()
+        inside_grid[valid] = ((points[valid] >= self._origin)
+                              & (points[valid] <= self._origin + self._cell_size * self._grid_size)).all(axis=1)
+
+        # candidate (point, feature) pairs from the grid, grouped by feature
+        starts = np.where(inside_grid, self._cell_offsets[np.maximum(cell_ids, 0)], 0)
+        counts = np.where(inside_grid, self._cell_offsets[np.maximum(cell_ids, 0) + 1] - starts, 0)
+        point_ids = np.repeat(np.arange(len(points)), counts)
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        features = self._cell_features[positions]
+        order = np.argsort(features, kind="stable")
+        point_ids, features = point_ids[order], features[order]
+
+        # bounding box filter before the edge tests
+        box = self.bounds[features]
+        candidate_points = points[point_ids]
+        in_box = ((candidate_points >= box[:, :2]) & (candidate_points <= box[:, 2:])).all(axis=1)
+        point_ids, features = point_ids[in_box], features[in_box]
+
+        for feature in np.unique(features):
+            ids = point_ids[features == feature]
+            ids = ids[found[ids] < 0]
+            edges = self._edges[self._edge_offsets[feature] : self._edge_offsets[feature + 1]]
+            if len(ids) == 0 or len(edges) == 0:
+                continue
+            chunk = max(1, self.max_tests // len(edges))
+            for start in range(0, len(ids), chunk):
+                chunk_ids = ids[start : start + chunk]
+                inside = self._contains(edges, points[chunk_ids])
+                found[chunk_ids[inside]] = feature
+        return found
+
+    @staticmethod
+    def _contains(edges, points):
+        """Even-odd test of points against the edges of the rings of one feature."""
+        x, y = points[:, :1], points[:, 1:]
+        x0, y0, x1, y1 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+        straddles = (y0 > y) != (y1 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        crossings = straddles & (x < crossing_x)
+        return crossings.sum(axis=1) % 2 == 1
@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from src.compressed_responses import ENCODINGS, BEST_LEVELS, build_version, compress
+
+
+MANIFEST_FILE = "export_manifest.json"
+
+# file types that are worth precompressing, images and fonts are compressed already
+COMPRESSIBLE = (".html", ".json", ".geojson", ".topojson", ".css", ".js", ".svg", ".txt")
+
+# file extension of each precompressed encoding
+ENCODING_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+# sends visitors of the site root to today's page, computed in the browser
+LANDING_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Seattle Domestic Violence Risk</title>
+  <script>
+    var today = new Date();
+    var pad = function(n) { return (n < 10 ? '0' : '') + n; };
+    window.location.replace('/' + pad(today.getMonth() + 1) + '-' + pad(today.getDate()) + '-' + today.getFullYear() + '/');
+  </script>
+</head>
+<body></body>
+</html>
+"""
+
+# the dashboard app of each export worker process
+_app = None
+
+
+def write_file(output_dir, path, body):
+    """Writes a file of the exported site and its precompressed copies, replacing them atomically.
+
+    Parameters
+    -----------
+    output_dir: directory of the exported site
+    path: path of the file relative to output_dir
+    body: bytes of the file
+
+    Returns
+    --------
+    list of the paths written, relative to output_dir
+    """
+    written = []
+    versions = [("", body)]
+    if path.endswith(COMPRESSIBLE):
+        versions += [(ENCODING_EXTENSIONS[encoding], compress(body, encoding, BEST_LEVELS)) for encoding in ENCODINGS]
+    for extension, data in versions:
+        full_path = os.path.join(output_dir, path + extension)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+        written.append(path + extension)
+    return written
+
+
+def page_paths(date):
+    """Returns the exported paths of a date's pages and the app urls they're rendered from.
+
+    Parameters
+    -----------
+    date: datetime.date
+
+    Returns
+    --------
+    list of (path, url) tuples
+    """
+    iso = date.isoformat()
+    return [
+        # the date picker links to mm-dd-yyyy
+        (date.strftime("%m-%d-%Y") + "/index.html", "/" + date.strftime("%m-%d-%Y")),
+        ("table/" + iso + "/index.html", "/table/" + iso),
+        ("api/colors/" + iso + ".json", "/api/colors/" + iso),
+    ]
+
+
+def date_fingerprints(snapshot, template_dir="templates"):
+    """Hashes everything a date's exported pages are rendered from.
+
+    A date's hash changes when its forecasts change, or when anything shared by every page
+    (the app code and templates, neighborhoods, long-term averages, geometry) changes. The
+    code and templates are hashed by build_version like the app's etags, from the app
+    directory the export runs in.
+
+    Parameters
+    -----------
+    snapshot: DashboardSnapshot
+    template_dir: directory of the app templates
+
+    Returns
+    --------
+    dictionary of ISO dates to hashes
+    """
+    shared = hashlib.sha1()
+    shared.update(build_version(["app.py", "src", template_dir]).encode("ascii"))
+    forecast_arrays = snapshot.forecast_arrays
+    shared.update(json.dumps(forecast_arrays.neighborhoods).encode("utf-8"))
+    shared.update(snapshot.table_averages.tobytes())
+    shared.update(snapshot.neighborhood_geojson)
+    fingerprints = {}
+    for i, date in enumerate(forecast_arrays.dates.astype(str)):
+        digest = shared.copy()
+        for values in [forecast_arrays.predictions, forecast_arrays.ratings, forecast_arrays.city]:
+            digest.update(values[i].tobytes())
+        fingerprints[date] = digest.hexdigest()
+    return fingerprints
+
+
+def _init_worker():
+    """Loads the dashboard app once in each export process."""
+    global _app
+    sys.path.insert(0, os.getcwd())
+    import app
+
+    _app = app
+
+
+def render(url):
+    """Renders an app url without compression, raising if it doesn't answer 200."""
+    response = _app.app.test_client().get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} answered {response.status_code}")
+    return response.data
+
+
+def export_dates(output_dir, dates):
+    """Renders and writes the pages of a batch of dates. Runs in an export worker process.
+
+    Parameters
+    -----------
+    output_dir: directory of the exported site
+    dates: list of ISO date strings
+
+    Returns
+    --------
+    list of the paths written, relative to output_dir
+    """
+    import datetime as dt
+
+    written = []
+    for iso in dates:
+        for path, url in page_paths(dt.date.fromisoformat(iso)):
+            written += write_file(output_dir, path, render(url))
+    return written
+
+
+def export_shared(output_dir, snapshot_dir="dashboard_data", static_dir="static"):
+    """Writes the pages and assets shared by every date: base map, geometry, static files and landing page.
+
+    Returns
+    --------
+    list of the paths written, relative to output_dir
+    """
+    written = []
+    app = _app.app
+    with app.test_request_context():
+        _app.use_current_snapshot()
+        written += write_file(output_dir, "basemap/index.html",
+                              _app.render_basemap(colors_suffix=".json").encode("utf-8"))
+        written += write_file(output_dir, "404.html", _app.render_template("404.html").encode("utf-8"))
+        levels = _app.g.snapshot.geometry_levels
+    written += write_file(output_dir, "geometry/seattle_neighborhood_shapes.geojson",
+                          _app.read_file(os.path.join(snapshot_dir, "seattle_neighborhood_shapes.geojson")))
+    for level in levels:
+        filename = os.path.basename(level["url"])
+        written += write_file(output_dir, "geometry/" + filename,
+                              _app.read_file(os.path.join(snapshot_dir, "geometry", filename)))
+    written += write_file(output_dir, "index.html", LANDING_PAGE.encode("utf-8"))
+    for root, dirs, files in os.walk(static_dir):
+        for filename in files:
+            source = os.path.join(root, filename)
+            path = os.path.relpath(source, static_dir)
+            target = os.path.join(output_dir, path)
+            # static files are only copied again when they've been modified since the last export
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                continue
+            written += write_file(output_dir, path, _app.read_file(source))
+    return written
+
+
+def remove_date(output_dir, iso):
+    """Deletes the exported pages of a date that is no longer forecast."""
+    import datetime as dt
+
+    for path, url in page_paths(dt.date.fromisoformat(iso)):
+        for extension in [""] + [ENCODING_EXTENSIONS[encoding] for encoding in ENCODINGS]:
+            full_path = os.path.join(output_dir, path + extension)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+        directory = os.path.dirname(os.path.join(output_dir, path))
+        if os.path.isdir(directory) and not os.listdir(directory):
+            shutil.rmtree(directory)
+
+
+def export_site(output_dir="static_site", processes=None, batch_size=31, force=False):
+    """Exports every forecast day of the dashboard as a static site, rebuilding only changed dates.
+
+    The manifest of date hashes is written last, so an interrupted export is picked up by
+    the next run.
+
+    Parameters
+    -----------
+    output_dir: directory of the exported site
+    processes: number of export processes, None for the number of cpus
+    batch_size: number of dates rendered per task
+    force: rebuild every date
+
+    Returns
+    --------
+    dictionary of counts of rebuilt, unchanged and removed dates
+    """
+    _init_worker()
+    snapshot = _app.snapshots.current
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    previous = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            previous = json.load(f)["dates"]
+
+    fingerprints = date_fingerprints(snapshot)
+    changed = [iso for iso, digest in fingerprints.items() if previous.get(iso) != digest]
+    removed = [iso for iso in previous if iso not in fingerprints]
+
+    export_shared(output_dir, snapshot.data_dir)
+    batches = [changed[i : i + batch_size] for i in range(0, len(changed), batch_size)]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        list(pool.map(export_dates, [output_dir] * len(batches), batches))
+    for iso in removed:
+        remove_date(output_dir, iso)
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"snapshot": snapshot.version, "dates": fingerprints}, f)
+    os.replace(tmp_path, manifest_path)
+    return {"rebuilt": len(changed), "unchanged": len(fingerprints) - len(changed), "removed": len(removed)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every forecast day of the dashboard as a static site.")
+    parser.add_argument("output_dir", nargs="?", default="static_site")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="rebuild every date")
+    args = parser.parse_args()
+    print(json.dumps(export_site(args.output_dir, processes=args.processes, force=args.force)))